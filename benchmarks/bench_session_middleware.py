@@ -0,0 +1,75 @@
+"""
+Накладные расходы middleware переадресации на запрос: @app.middleware("http") (BaseHTTPMiddleware)
+и SessionRedirectMiddleware (чистый ASGI). Приложение-заглушка отвечает сразу, без FastAPI
+Запуск: python -m benchmarks.bench_session_middleware
+"""
+import asyncio
+import time
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+from middleware_handler import SessionRedirectMiddleware
+
+
+NUMBER = 20_000
+
+
+async def endpoint(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'2')]})
+    await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+async def check_session_middleware(request: Request, call_next):
+    # прежняя реализация из main.py
+    if request.url.path in ['/lk', '/lk/login', '/lk/registration']:
+        user_session = request.cookies.get("user_session")
+        if user_session:
+            return RedirectResponse(url='/lk/me', status_code=303)
+    response = await call_next(request)
+    return response
+
+
+def make_scope(path: str, cookie: bool) -> dict:
+    headers = [(b'host', b'test'), (b'authorization', b'Bearer token')]
+    if cookie:
+        headers.append((b'cookie', b'user_session=abc'))
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'', 'headers': headers,
+            'client': ('127.0.0.1', 1), 'server': ('test', 80)}
+
+
+async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def send(_):
+    pass
+
+
+async def measure(app, scope) -> float:
+    for _ in range(1000):
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(NUMBER):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / NUMBER * 1e6
+
+
+async def main():
+    apps = {
+        'none': endpoint,
+        'BaseHTTPMiddleware': BaseHTTPMiddleware(endpoint, dispatch=check_session_middleware),
+        'SessionRedirectMiddleware': SessionRedirectMiddleware(endpoint),
+    }
+    cases = {
+        'GET /task/ (pass through)': make_scope('/task/', False),
+        'GET /lk, no cookie': make_scope('/lk', False),
+        'GET /lk, cookie (redirect)': make_scope('/lk', True),
+    }
+    for case, scope in cases.items():
+        for name, app in apps.items():
+            print(f'{case:<28} {name:<26} {await measure(app, scope):8.2f} us/request')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
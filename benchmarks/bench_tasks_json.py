@@ -0,0 +1,51 @@
+"""
+Сравнение сериализации списка задач: модель TasksList + jsonable_encoder и json_handler.dumps
+Запуск: python -m benchmarks.bench_tasks_json
+"""
+import datetime
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from json_handler import dumps
+from models import TasksList
+
+
+NUMBER = 5
+
+
+def make_rows(count: int) -> list[dict]:
+    dt = datetime.datetime(2025, 3, 8, 12, 0, 0)
+    return [
+        {
+            'id': i,
+            'email': 'bench@test.com',
+            'title': f'Задача {i}',
+            'description': 'Описание задачи ' * 4,
+            'status': 'WAIT',
+            'level': i % 4,
+            'dt_to': dt + datetime.timedelta(days=i % 30),
+            'dt': dt + datetime.timedelta(seconds=i),
+            'file': None if i % 3 else f'{i}.pdf',
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    for count in (1_000, 10_000):
+        rows = make_rows(count)
+
+        def model_path():
+            content = TasksList(status=True, data=rows, next_cursor=None)
+            JSONResponse(jsonable_encoder(content)).body
+
+        def fast_path():
+            dumps({'status': True, 'data': rows, 'next_cursor': None})
+
+        for name, func in {'TasksList + jsonable_encoder': model_path, 'json_handler.dumps': fast_path}.items():
+            seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+            print(f'{count:>6} tasks  {name:<30} {seconds / NUMBER * 1e3:8.2f} ms/response')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Сравнение проверки токена: jwt.decode на каждый вызов и кэш decode_token
+Запуск: python -m benchmarks.bench_token_cache
+"""
+import timeit
+import jwt
+from config import settings
+from encryption import create_access_token, decode_token, TokenTypes, ALGORITHM, TOKENS_CACHE
+
+
+NUMBER = 100_000
+
+
+def main():
+    token = create_access_token('bench@test.com', TokenTypes.BEARER)
+    bad_token = token[:-4] + 'AAAA'
+
+    def jwt_path():
+        jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+
+    def jwt_bad_path():
+        try:
+            jwt.decode(bad_token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.InvalidTokenError:
+            pass
+
+    TOKENS_CACHE.clear()
+    decode_token(token)
+    decode_token(bad_token)
+    cases = {
+        'jwt.decode (valid)': jwt_path,
+        'decode_token hit (valid)': lambda: decode_token(token),
+        'jwt.decode (invalid)': jwt_bad_path,
+        'decode_token hit (invalid)': lambda: decode_token(bad_token),
+    }
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+        print(f'{name:<28} {seconds / NUMBER * 1e6:8.2f} us/call')
+    print(TOKENS_CACHE.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+from redis_handler import redis_conn
+from config import settings
+
+
+# канал Редис для сброса кэша пользователей во всех воркерах
+USERS_CACHE_CHANNEL = 'users-cache-invalidate'
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш со сроком жизни записей
+    ::generation:: счетчик сбросов, защищает от записи устаревших данных после invalidate
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Значение по ключу, если запись не устарела
+        """
+        item = self._data.get(key)
+        if item is not None:
+            value, expire = item
+            if expire > self.timer():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float | None = None, generation: int | None = None) -> None:
+        """
+        Запись значения
+        :param ttl: срок жизни записи (по умолчанию общий для кэша)
+        :param generation: поколение кэша на момент чтения данных, если с тех пор был сброс - запись пропускается
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (value, self.timer() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# кэш записей пользователей по емейл
+USERS_CACHE = TTLCache(settings.USERS_CACHE_SIZE, settings.USERS_CACHE_TTL)
+
+
+async def invalidate_user(email: str) -> None:
+    """
+    Сброс пользователя в кэше воркера и, если включено, во всех воркерах через Редис
+    """
+    USERS_CACHE.invalidate(email)
+    if not settings.USERS_CACHE_PUBSUB:
+        return
+    try:
+        async with redis_conn() as r:
+            await r.publish(USERS_CACHE_CHANNEL, email)
+    except Exception:
+        traceback.print_exc()
+
+
+async def users_cache_listener() -> None:
+    """
+    Подписка на сбросы кэша пользователей из других воркеров (запускается в lifespan)
+    """
+    while True:
+        try:
+            async with redis_conn() as r:
+                async with r.pubsub() as pubsub:
+                    await pubsub.subscribe(USERS_CACHE_CHANNEL)
+                    # пропущенные за время переподключения сбросы неизвестны
+                    USERS_CACHE.clear()
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            USERS_CACHE.invalidate(message['data'])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+            await asyncio.sleep(1)
@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import IPvAnyAddress, EmailStr, HttpUrl
 
@@ -11,6 +12,13 @@ class Settings(BaseSettings):
     REDIS_PSW: str
     EMAIL_USER: str
     EMAIL_PSW: str
+    EMAIL_HOST: str = 'smtp.yandex.ru'
+    EMAIL_PORT: int = 587
+    # для локального SMTP без шифрования и авторизации оба флага выключаются
+    EMAIL_STARTTLS: bool = True
+    EMAIL_LOGIN: bool = True
+    EMAIL_TIMEOUT: float = 10.0
+    EMAIL_IDLE_TIMEOUT: float = 60.0
     S3_ACCESS: str
     S3_SECRET: str
     BUCKET_NAME: str
@@ -18,6 +26,77 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_DAYS: int
     ACCESS_COOKIE_EXPIRE_DAYS: int
     UPLOAD_SIZE: int
+    # пул соединений Постгрес (на каждый воркер uvicorn)
+    PG_POOL_MIN_SIZE: int = 2
+    PG_POOL_MAX_SIZE: int = 10
+    PG_POOL_ACQUIRE_TIMEOUT: float = 5.0
+    PG_POOL_MAX_INACTIVE_LIFETIME: float = 300.0
+    PG_POOL_MAX_QUERIES: int = 50000
+    # кэш пользователей для проверки токенов
+    USERS_CACHE_SIZE: int = 10000
+    USERS_CACHE_TTL: float = 60.0
+    USERS_CACHE_PUBSUB: bool = False
+    # кэш проверенных JWT-токенов
+    TOKENS_CACHE_SIZE: int = 10000
+    TOKENS_CACHE_MAX_TTL: float = 3600.0
+    TOKENS_CACHE_NEGATIVE_TTL: float = 30.0
+    # пул потоков для bcrypt и лимит очереди к нему
+    HASH_POOL_SIZE: int = 2
+    HASH_QUEUE_SIZE: int = 16
+    # постраничная выдача задач
+    TASKS_PAGE_SIZE: int = 100
+    TASKS_PAGE_MAX: int = 1000
+    # размер пачки строк при выгрузке задач
+    TASKS_EXPORT_BATCH: int = 500
+    # максимальный размер пачки при массовых операциях над задачами
+    TASKS_BULK_MAX: int = 1000
+    # общий клиент s3
+    S3_MAX_POOL_CONNECTIONS: int = 20
+    S3_KEEPALIVE_TIMEOUT: float = 60.0
+    S3_CONNECT_TIMEOUT: float = 5.0
+    S3_READ_TIMEOUT: float = 30.0
+    # срок действия подписанных ссылок на загрузку и скачивание файлов (секунды)
+    S3_PRESIGN_EXPIRES: int = 600
+    # срок хранения загрузок по подписанной форме без подтверждения (дни)
+    S3_PENDING_EXPIRE_DAYS: int = 1
+    # общий клиент Редис
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 2.0
+    REDIS_SOCKET_TIMEOUT: float = 2.0
+    REDIS_CONNECT_TIMEOUT: float = 2.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    # блокировка адресов за неудачные проверки токена:
+    # путь -> (порог ошибок, окно в секундах, срок блокировки в секундах)
+    AUTH_FAIL_RULES: dict[str, tuple[int, int, int]] = {
+        'default': (10, 600, 3600),
+        '/task': (10, 600, 3600),
+        '/confirm': (5, 600, 3600),
+    }
+    AUTH_BANNED_CACHE_SIZE: int = 10000
+    # ограничение частоты запросов: redis - fastapi_limiter, hybrid - локальные ведра со сверкой в Редис
+    RATE_LIMITER: Literal['redis', 'hybrid'] = 'redis'
+    HYBRID_LIMITER_SYNC_INTERVAL: float = 1.0
+    HYBRID_LIMITER_SYNC_TIMEOUT: float = 0.2
+    # доля лимита, которую ключ может израсходовать без сверки
+    HYBRID_LIMITER_ERROR_BUDGET: float = 0.2
+    # отправка писем из таблицы Outbox
+    OUTBOX_DISPATCHER: bool = True
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_INTERVAL: float = 2.0
+    # через сколько секунд неотправленная пачка захватывается повторно (больше ожидания и повторов фоновой задачи)
+    OUTBOX_LOCK_TIMEOUT: int = 300
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # фоновые задачи: celery - отдельный воркер через брокер Редис, asyncio - очередь в процессе приложения
+    JOB_BACKEND: Literal['celery', 'asyncio'] = 'celery'
+    JOB_QUEUE_SIZE: int = 1000
+    JOB_WORKERS: int = 4
+    JOB_RETRIES: int = 3
+    JOB_RETRY_BACKOFF: float = 1.0
+    JOB_DRAIN_TIMEOUT: float = 10.0
+    # замеры этапов запроса (заголовок Server-Timing): доля запросов в выборке, 0 - выключено
+    TIMING_SAMPLE_RATE: float = 0.0
+    # строка с замерами запроса (json) в лог middleware_handler уровня INFO
+    TIMING_LOG: bool = False
 
     @property
     def REDIS_URL(self):
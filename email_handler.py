@@ -1,32 +1,118 @@
 import smtplib
+import threading
+import time
+import traceback
 from email.message import EmailMessage
 from config import settings
 
 
-def send_email(recipient: str, subject: str, message_body: str) -> bool:
+# соединение с SMTP-сервером процесса (воркера), переиспользуется между задачами
+SMTP_CONNECTION: smtplib.SMTP | None = None
+SMTP_LAST_USED = 0.0
+SMTP_LOCK = threading.Lock()
+
+
+def smtp_connect() -> smtplib.SMTP:
+    """
+    Инициализация соединения с SMTP-сервером
+    """
+    server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT)
+    if settings.EMAIL_STARTTLS:
+        server.starttls()
+    if settings.EMAIL_LOGIN:
+        server.login(settings.EMAIL_USER, settings.EMAIL_PSW)
+    return server
+
+
+def smtp_close() -> None:
+    """
+    Закрытие соединения процесса, ошибки закрытия не важны
+    """
+    global SMTP_CONNECTION
+    if SMTP_CONNECTION is not None:
+        try:
+            SMTP_CONNECTION.quit()
+        except Exception:
+            SMTP_CONNECTION.close()
+        SMTP_CONNECTION = None
+
+
+def get_smtp() -> smtplib.SMTP:
+    """
+    Соединение процесса: открывается при первой отправке и заново, если простаивало дольше EMAIL_IDLE_TIMEOUT
+    (сервер к этому времени обычно сам его закрывает)
+    """
+    global SMTP_CONNECTION
+    if SMTP_CONNECTION is not None and time.monotonic() - SMTP_LAST_USED > settings.EMAIL_IDLE_TIMEOUT:
+        smtp_close()
+    if SMTP_CONNECTION is None:
+        SMTP_CONNECTION = smtp_connect()
+    return SMTP_CONNECTION
+
+
+CONFIRM_SUBJECT = 'Подтверждение электронной почты - To-Do micro-api'
+
+
+def confirm_message(recipient: str, username: str, url_confirm: str) -> tuple[str, str, str]:
+    """
+    Письмо подтверждения почты: (емейл адресата, тема, тело сообщения)
+    """
+    return (recipient, CONFIRM_SUBJECT,
+            f'Здравствуйте, {username}\n'
+            f'Для подтверждения своей почты в сервисе To-Do micro-api перейдите по ссылке ниже:\n'
+            f'{url_confirm}')
+
+
+def create_message(recipient: str, subject: str, message_body: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg.set_content(message_body)
+    msg["Subject"] = subject
+    msg["From"] = settings.EMAIL_USER
+    msg["To"] = recipient
+    return msg
+
+
+def send_message(msg: EmailMessage) -> None:
+    """
+    Отправка сообщения через соединение процесса
+    При разрыве соединения выполняется одно переподключение
+    """
+    global SMTP_LAST_USED
+    with SMTP_LOCK:
+        for attempt in range(2):
+            try:
+                get_smtp().send_message(msg)
+                SMTP_LAST_USED = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError):
+                smtp_close()
+                if attempt:
+                    raise
+
+
+def send_email(recipient: str, subject: str, message_body: str) -> None:
     """
     Отправка емейл
     :param recipient: емейл адресата
     :param subject: тема
     :param message_body: тело сообщения
-    :return: True | False
+    :raise smtplib.SMTPException | OSError: письмо не отправлено (фоновая задача повторяется)
     """
-    try:
-        # инициализация соединения с сервером
-        server = smtplib.SMTP('smtp.yandex.ru', 587)
-        server.starttls()
-        server.login(settings.EMAIL_USER, settings.EMAIL_PSW)
+    send_message(create_message(recipient, subject, message_body))
+
 
-        # создание сообщения
-        msg = EmailMessage()
-        msg.set_content(message_body)
-        msg["Subject"] = subject
-        msg["From"] = settings.EMAIL_USER
-        msg["To"] = recipient
-
-        # отправка и закрытие соединения
-        server.send_message(msg)
-        server.close()
-        return True
-    except Exception:
-        return False
+def send_emails(messages: list[tuple[str, str, str]]) -> list[bool]:
+    """
+    Отправка пачки емейл за одну сессию SMTP, ошибка одного письма не прерывает отправку остальных
+    :param messages: список (емейл адресата, тема, тело сообщения)
+    :return: результат по каждому сообщению
+    """
+    results = []
+    for message in messages:
+        try:
+            send_email(*message)
+            results.append(True)
+        except Exception:
+            traceback.print_exc()
+            results.append(False)
+    return results
@@ -1,11 +1,20 @@
+import asyncio
+import functools
+import hashlib
 import random
 import string
+import threading
+import time
+import traceback
 import jwt
 import bcrypt
 import datetime
-from redis_handler import redis_add_key
+from cache_handler import TTLCache
+from redis_handler import redis_auth_failure
 from sql_handler_v2 import Pg
+from timing_handler import span
 from config import settings
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 
@@ -17,8 +26,18 @@ class TokenTypes(Enum):
 
 # константы для хеширования паролей
 ALGORITHM = 'HS256'
-# временный словарь для отслеживания ip пользователей
-CLIENT_HOSTS = {}
+# известные этому воркеру блокировки из Редис: (путь, айпи) -> True до конца блокировки
+BANNED_HOSTS = TTLCache(settings.AUTH_BANNED_CACHE_SIZE, 0)
+# пул потоков для bcrypt (hashpw/checkpw отпускают GIL) и слоты занятых + ожидающих задач
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=settings.HASH_POOL_SIZE, thread_name_prefix='bcrypt')
+HASH_SLOTS = threading.BoundedSemaphore(settings.HASH_POOL_SIZE + settings.HASH_QUEUE_SIZE)
+# кэш проверенных токенов: sha256(токен) -> (отпечаток ключа, payload | None)
+TOKENS_CACHE = TTLCache(settings.TOKENS_CACHE_SIZE, settings.TOKENS_CACHE_MAX_TTL)
+
+
+class HashPoolBusy(Exception):
+    """Очередь пула хеширования паролей переполнена"""
+    pass
 
 
 def generate_code(length):
@@ -51,6 +70,40 @@ def verify_password(plain_password: str, hashed_password: bytes) -> bool:
     return bcrypt.checkpw(plain_password_bytes, hashed_password)
 
 
+def run_in_hash_pool(func, *args) -> asyncio.Future:
+    """
+    Запуск функции в пуле HASH_EXECUTOR без блокировки цикла событий
+    Слот освобождается по завершении потока, даже если запрос уже отменен
+    :raise HashPoolBusy: все слоты пула и очереди заняты
+    """
+    slots = HASH_SLOTS
+    if not slots.acquire(blocking=False):
+        raise HashPoolBusy()
+    try:
+        future = HASH_EXECUTOR.submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> bytes:
+    """
+    Создание хэша пароля в пуле потоков
+    """
+    with span('bcrypt'):
+        return await run_in_hash_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: bytes) -> bool:
+    """
+    Проверка пароля в пуле потоков
+    """
+    with span('bcrypt'):
+        return await run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
 def create_access_token(email: str, type_token: TokenTypes):
     """
     Создание токена
@@ -71,20 +124,69 @@ def create_access_token(email: str, type_token: TokenTypes):
     return jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def check_clients_dict(client_host: str, path: str) -> None:
+@functools.lru_cache(maxsize=4)
+def secret_fingerprint(secret_key: str) -> bytes:
+    """
+    Отпечаток ключа подписи, при смене SECRET_KEY записи кэша токенов перестают совпадать
+    """
+    return hashlib.sha256(secret_key.encode("utf-8")).digest()
+
+
+def decode_token(token: str) -> dict | None:
+    """
+    Проверка подписи и декодирование токена с кэшированием результата
+    Верный токен хранится до своего exp, неверный - TOKENS_CACHE_NEGATIVE_TTL
+    :param token: токен
+    :return: payload | None
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    fingerprint = secret_fingerprint(settings.SECRET_KEY)
+    cached = TOKENS_CACHE.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    try:
+        with span('jwt'):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        TOKENS_CACHE.set(key, (fingerprint, None), ttl=settings.TOKENS_CACHE_NEGATIVE_TTL)
+        return None
+    exp = payload.get('exp')
+    if isinstance(exp, (int, float)):
+        ttl = min(exp - time.time(), settings.TOKENS_CACHE_MAX_TTL)
+        if ttl > 0:
+            TOKENS_CACHE.set(key, (fingerprint, payload), ttl=ttl)
+    return payload
+
+
+def is_banned(client_host: str, path: str) -> bool:
     """
-    Увеличение счетчика ошибок по айпи пользователей
+    Проверка блокировки адреса без обращения к Редис
+    Блокировка общая для всех воркеров (ключ в Редис) и попадает в BANNED_HOSTS воркера при учете ошибки
+    (register_auth_failure): заблокированный на другом воркере адрес узнает о ней на первой же ошибке
+    :param client_host: айпи клиента
+    :param path: ссылка
+    :return: True - адрес заблокирован
+    """
+    return BANNED_HOSTS.get((path, client_host)) is not None
+
+
+async def register_auth_failure(client_host: str, path: str) -> None:
+    """
+    Учет неудачной проверки токена по айпи пользователя
+    Счетчик общий для всех воркеров (скользящее окно в Редис), порог и срок блокировки - из AUTH_FAIL_RULES
+    Действующая блокировка (в том числе выставленная другим воркером) кэшируется в BANNED_HOSTS до ее окончания
     :param client_host: айпи клиента
     :param path: ссылка
     :return: None
     """
-    if client_host not in CLIENT_HOSTS.keys():
-        CLIENT_HOSTS[client_host] = 1
-    else:
-        CLIENT_HOSTS[client_host] += 1
-        if CLIENT_HOSTS[client_host] >= 10:
-            await redis_add_key(f'fastapi-limiter:{client_host}:{path}:12:0', '10', 3600)
-            CLIENT_HOSTS[client_host] = 0
+    limit, window, ban = settings.AUTH_FAIL_RULES.get(path, settings.AUTH_FAIL_RULES['default'])
+    try:
+        ban_ms = await redis_auth_failure(client_host, path, limit, window, ban)
+    except Exception:
+        traceback.print_exc()
+        return
+    if ban_ms > 0:
+        BANNED_HOSTS.set((path, client_host), True, ttl=ban_ms / 1000)
 
 
 async def check_token(token: str, type_token: TokenTypes, client_host: str | None, path: str | None) -> dict | bool:
@@ -97,24 +199,23 @@ async def check_token(token: str, type_token: TokenTypes, client_host: str | Non
     :return: True | False
     """
     # получаем данные пользователя из токена
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-    except Exception:
+    payload = decode_token(token)
+    if payload is None:
         # добавляем в список пользователей с ошибкой
-        await check_clients_dict(client_host, path) if client_host is not None else None
+        await register_auth_failure(client_host, path) if client_host is not None else None
         return False
     try:
         # определяем тип, почту, срок действия токена
         type_, email, exp = payload.get('type_token'), payload.get('email'), payload.get('exp')
         # сверяем тип и срок действия
         if type_token.value['name'] != type_ or exp < datetime.datetime.now().timestamp():
-            await check_clients_dict(client_host, path) if client_host is not None else None
+            await register_auth_failure(client_host, path) if client_host is not None else None
             return False
         # определяем и возвращаем пользователя
-        user = await Pg.Users.get(email)
+        user = await Pg.Users.get_cached(email)
         return user
     except Exception:
-        await check_clients_dict(client_host, path) if client_host is not None else None
+        await register_auth_failure(client_host, path) if client_host is not None else None
         return False
 
 
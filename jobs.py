@@ -0,0 +1,91 @@
+import asyncio
+import inspect
+import logging
+import traceback
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Очередь фоновых задач переполнена"""
+    pass
+
+
+class AsyncioJobQueue:
+    """
+    Очередь фоновых задач в процессе приложения (альтернатива Celery для одного сервера)
+    Задачи выполняются ограниченным числом обработчиков, при ошибке повторяются с растущей паузой
+    Синхронные функции выполняются в отдельном потоке
+    """
+
+    def __init__(self, maxsize: int, workers: int, retries: int, backoff: float):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.queue: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+
+    def submit(self, func, args: tuple = (), kwargs: dict | None = None) -> None:
+        """
+        Постановка задачи в очередь
+        :raise JobQueueFull: очередь переполнена или не запущена
+        """
+        if self.queue is None:
+            raise JobQueueFull('Очередь фоновых задач не запущена')
+        try:
+            self.queue.put_nowait((func, args, kwargs or {}))
+        except asyncio.QueueFull:
+            raise JobQueueFull()
+
+    async def start(self) -> None:
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxsize)
+            self.tasks = [asyncio.create_task(self.worker(self.queue)) for _ in range(self.workers)]
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Остановка очереди: новые задачи не принимаются, поставленные выполняются не дольше timeout
+        """
+        queue, self.queue = self.queue, None
+        if queue is None:
+            return
+        try:
+            await asyncio.wait_for(queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Фоновые задачи не завершены при остановке: %s', queue.qsize())
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def run(self, func, args: tuple, kwargs: dict):
+        """
+        Выполнение задачи с повторами через backoff * 2 ** попытка секунд
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if inspect.iscoroutinefunction(func):
+                    return await func(*args, **kwargs)
+                return await asyncio.to_thread(func, *args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            func, args, kwargs = await queue.get()
+            try:
+                await self.run(func, args, kwargs)
+            except Exception:
+                pass
+            finally:
+                queue.task_done()
+
+
+# очередь фоновых задач процесса, запускается в lifespan при JOB_BACKEND = asyncio
+JOB_QUEUE = AsyncioJobQueue(settings.JOB_QUEUE_SIZE, settings.JOB_WORKERS, settings.JOB_RETRIES, settings.JOB_RETRY_BACKOFF)
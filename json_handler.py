@@ -0,0 +1,40 @@
+import datetime
+import json
+from asyncpg import Record
+from fastapi.responses import Response
+try:
+    import orjson
+except ImportError:  # без orjson используется стандартный json
+    orjson = None
+
+
+def default(obj):
+    """
+    Преобразование строк asyncpg и дат при сериализации
+    """
+    if isinstance(obj, Record):
+        return dict(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(content) -> bytes:
+    """
+    Сериализация в JSON за один проход: строки asyncpg превращаются в объекты по ходу записи,
+    без промежуточной проверки моделью и jsonable_encoder
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=default)
+    return json.dumps(content, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """
+    Ответ JSON из данных, которые не нужно проверять моделью (например, строк asyncpg)
+    Схема ответа для документации задается response_model маршрута
+    """
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,170 @@
+import asyncio
+import math
+import time
+import traceback
+from fastapi import HTTPException, Request, Response, status as fastapi_status
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from redis_handler import redis_conn
+from config import settings
+from timing_handler import span
+from metrics_handler import LIMITER_REJECTIONS, route_name
+
+
+# все гибридные ограничители для фоновой сверки с Редис
+LIMITERS = []
+# сигнал внеочередной сверки (превышен бюджет ошибки одного из ведер)
+SYNC_EVENT = asyncio.Event()
+
+
+class TokenBucket:
+    """
+    Ведро токенов ключа в памяти воркера
+    ::pending:: израсходовано локально и еще не отправлено в Редис
+    ::seen:: общий расход окна в Редис при последней сверке
+    """
+    __slots__ = ('tokens', 'updated', 'pending', 'seen', 'window')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.pending = 0
+        self.seen = 0
+        self.window = None
+
+
+class HybridRateLimiter:
+    """
+    Ограничение частоты запросов без обращения к Редис на каждый запрос
+    Решение принимается по локальному ведру токенов, расход ключей сверяется с Редис
+    пачкой (pipeline) раз в HYBRID_LIMITER_SYNC_INTERVAL или сразу, если несверенный расход ключа
+    превысил бюджет ошибки HYBRID_LIMITER_ERROR_BUDGET. Если Редис не ответил за
+    HYBRID_LIMITER_SYNC_TIMEOUT, ограничение остается локальным до следующей сверки,
+    а расход этой сверки не отправляется повторно (см. sync)
+    """
+    timer = time.monotonic
+
+    def __init__(self, times: int, milliseconds: int = 0, seconds: int = 0, minutes: int = 0, hours: int = 0):
+        self.times = times
+        self.period = milliseconds / 1000 + seconds + 60 * minutes + 3600 * hours
+        self.rate = times / self.period
+        # сколько запросов ключа можно пропустить без сверки
+        self.budget = max(1, math.floor(times * settings.HYBRID_LIMITER_ERROR_BUDGET))
+        self.buckets: dict[str, TokenBucket] = {}
+        self.index = len(LIMITERS)
+        LIMITERS.append(self)
+
+    async def __call__(self, request: Request, response: Response):
+        forwarded = request.headers.get('X-Forwarded-For')
+        ip = forwarded.split(',')[0] if forwarded else request.client.host
+        retry_after = self.take(f'{request.method}:{ip}:{request.scope["path"]}')
+        if retry_after:
+            LIMITER_REJECTIONS.labels('hybrid', route_name(request.scope)).inc()
+            raise HTTPException(status_code=fastapi_status.HTTP_429_TOO_MANY_REQUESTS, detail='Too Many Requests',
+                                headers={'Retry-After': str(retry_after)})
+
+    def take(self, key: str) -> int:
+        """
+        Списание токена из ведра ключа
+        :return: 0 - запрос разрешен, иначе через сколько секунд повторить
+        """
+        now = self.timer()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.times, now)
+        else:
+            bucket.tokens = min(self.times, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens < 1:
+            return math.ceil((1 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1
+        bucket.pending = min(bucket.pending + 1, self.times)
+        if bucket.pending >= self.budget:
+            SYNC_EVENT.set()
+        return 0
+
+    def reconcile(self, bucket: TokenBucket, window: int, sent: int, total: int) -> None:
+        """
+        Учет расхода других воркеров после сверки
+        :param window: номер окна счетчика в Редис
+        :param sent: отправленный в этой сверке локальный расход
+        :param total: общий расход окна после сверки
+        """
+        others = total - sent - (bucket.seen if bucket.window == window else 0)
+        bucket.tokens = max(-self.times, bucket.tokens - max(others, 0))
+        bucket.seen, bucket.window = total, window
+
+    async def sync(self) -> None:
+        """
+        Отправка локального расхода в Редис и получение общего одним pipeline
+        Ведра без расхода дольше периода удаляются
+        Расход ведер забирается (pending обнуляется) до отправки: если pipeline прервался по таймауту
+        или ошибке, расход этой сверки не отправляется повторно и в общем счетчике не удваивается.
+        Не дошедший до Редис расход теряется (счетчик занижен на одну сверку), а дошедший без ответа
+        при следующей сверке один раз засчитывается ведру как расход других воркеров
+        """
+        now = self.timer()
+        for key in [k for k, b in self.buckets.items() if b.pending == 0 and now - b.updated > self.period]:
+            del self.buckets[key]
+        if not self.buckets:
+            return
+        window = int(time.time() // self.period)
+        items = [(key, bucket, bucket.pending) for key, bucket in self.buckets.items()]
+        for _, bucket, _ in items:
+            bucket.pending = 0
+        async with redis_conn() as r:
+            async with r.pipeline(transaction=False) as pipe:
+                for key, _, sent in items:
+                    redis_key = f'hybrid-limiter:{self.index}:{key}:{window}'
+                    pipe.incrby(redis_key, sent)
+                    pipe.expire(redis_key, math.ceil(self.period))
+                results = await pipe.execute()
+        for (_, bucket, sent), total in zip(items, results[::2]):
+            self.reconcile(bucket, window, sent, int(total))
+
+
+async def sync_limiters() -> None:
+    """
+    Фоновая сверка всех гибридных ограничителей (запускается в lifespan)
+    """
+    while True:
+        try:
+            await asyncio.wait_for(SYNC_EVENT.wait(), settings.HYBRID_LIMITER_SYNC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        SYNC_EVENT.clear()
+        for limiter in LIMITERS:
+            try:
+                await asyncio.wait_for(limiter.sync(), settings.HYBRID_LIMITER_SYNC_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Редис недоступен или медленный - продолжаем локально
+                traceback.print_exc()
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Ограничитель fastapi_limiter с замером обращения к Редис (Server-Timing) и учетом отказов в метриках
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = self.reject
+
+    async def reject(self, request: Request, response: Response, pexpire: int):
+        LIMITER_REJECTIONS.labels('redis', route_name(request.scope)).inc()
+        return await FastAPILimiter.http_callback(request, response, pexpire)
+
+    async def _check(self, key):
+        async with span('redis'):
+            return await super()._check(key)
+
+
+def rate_limiter(times: int, **period):
+    """
+    Ограничитель частоты запросов по настройке RATE_LIMITER: redis (fastapi_limiter) | hybrid
+    """
+    if settings.RATE_LIMITER == 'hybrid':
+        return HybridRateLimiter(times, **period)
+    return RedisRateLimiter(times=times, **period)
@@ -1,53 +1,74 @@
+import asyncio
 import subprocess
 from contextlib import asynccontextmanager
 from routers import lk, task
-import redis.asyncio as redis
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi_limiter import FastAPILimiter
 from models import FormValidationError
-from routers.lk import templates
+from routers.lk import templates, prerender_pages
 from config import settings
+from sql_handler_v2 import init_pool, close_pool, pool_stats, Pg
+from outbox import run_dispatcher
+from jobs import JOB_QUEUE
+from static_handler import STATIC_ASSETS
+from middleware_handler import SessionRedirectMiddleware, ServerTimingMiddleware, MetricsMiddleware
+from metrics_handler import metrics_response, mark_process_dead
+from cache_handler import USERS_CACHE, users_cache_listener
+from s3_handler import init_client, close_client, s3_stats, init_pending_lifecycle
+from redis_handler import init_redis, close_redis
+from limiter_handler import sync_limiters
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     """
-    Инициализация Редис для fastapi_limiter
+    Отрисовка постоянных страниц, инициализация общего клиента Редис (и для fastapi_limiter), таблицы Outbox и индексов задач,
+    пула соединений Постгрес, клиента s3 и правила удаления неподтвержденных загрузок, очереди фоновых задач, подписки на сброс кэша, сверки гибридного ограничителя запросов и обработчика Outbox
     """
-    redis_connection = redis.from_url(settings.REDIS_URL, encoding="utf8")
-    await FastAPILimiter.init(redis_connection)
+    prerender_pages()
+    await FastAPILimiter.init(await init_redis())
+    await Pg.Dev.create_outbox()
+    await Pg.Dev.create_indexes()
+    await init_pool()
+    await init_client()
+    await init_pending_lifecycle()
+    if settings.JOB_BACKEND == 'asyncio':
+        await JOB_QUEUE.start()
+    listener = asyncio.create_task(users_cache_listener()) if settings.USERS_CACHE_PUBSUB else None
+    limiters_sync = asyncio.create_task(sync_limiters()) if settings.RATE_LIMITER == 'hybrid' else None
+    dispatcher = asyncio.create_task(run_dispatcher()) if settings.OUTBOX_DISPATCHER else None
     yield
+    for background_task in (listener, limiters_sync, dispatcher):
+        if background_task is not None:
+            background_task.cancel()
+    await JOB_QUEUE.drain(settings.JOB_DRAIN_TIMEOUT)
+    await close_client()
+    await close_pool()
     await FastAPILimiter.close()
+    await close_redis()
+    mark_process_dead()
 
 
 # инициализация фастапи
 app = FastAPI(lifespan=lifespan, title='To-Do mini', description='Позволяет хранить задачи в облаке. Для регистрации пройдите по ссылке: /registration', version='0.1b')
-# Подключение к статическим файлам (например, Bootstrap и стили)
-app.mount('/static', StaticFiles(directory='static'), name='static')
+# Подключение к статическим файлам (например, Bootstrap и стили): сжатые варианты и имена с хэшем
+app.mount('/static', STATIC_ASSETS, name='static')
+# переадресация авторизованных пользователей со страниц входа в ЛК
+app.add_middleware(SessionRedirectMiddleware)
+# замеры этапов запроса в заголовке Server-Timing (доля запросов TIMING_SAMPLE_RATE)
+app.add_middleware(ServerTimingMiddleware)
+# метрики Prometheus по маршрутам (/metrics)
+app.add_middleware(MetricsMiddleware)
 # подключение роутеров
 app.include_router(lk.router)
 app.include_router(task.router)
 
 
 
-@app.middleware("http")
-async def check_session_middleware(request: Request, call_next):
-    """
-    Обработчик запросов в ЛК
-    """
-    if request.url.path in ['/lk', '/lk/login', '/lk/registration']:
-        user_session = request.cookies.get("user_session")
-        if user_session:
-            return RedirectResponse(url='/lk/me', status_code=303)
-    response = await call_next(request)
-    return response
-
-
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """
@@ -70,11 +91,45 @@ async def index():
     return RedirectResponse(url='/lk', status_code=303)
 
 
+@app.get('/health/db', include_in_schema=False)
+async def health_db():
+    """
+    Загрузка пула соединений БД текущего воркера
+    """
+    return pool_stats()
+
+
+@app.get('/health/cache', include_in_schema=False)
+async def health_cache():
+    """
+    Счетчики попаданий кэша пользователей текущего воркера
+    """
+    return {'users': USERS_CACHE.stats()}
+
+
+@app.get('/health/s3', include_in_schema=False)
+async def health_s3():
+    """
+    Задержки вызовов s3 текущего воркера
+    """
+    return s3_stats()
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """
+    Метрики Prometheus всех воркеров (при PROMETHEUS_MULTIPROC_DIR) или текущего
+    """
+    content, media_type = metrics_response()
+    return Response(content, media_type=media_type)
+
+
 if __name__ == "__main__":
     celery_process = subprocess.Popen(
         ["celery", "-A", "tasks", "worker", "--loglevel=info"]
-    )
+    ) if settings.JOB_BACKEND == 'celery' else None
     try:
         uvicorn.run("main:app", reload=True, use_colors=True, workers=4)
     finally:
-        celery_process.terminate()
+        if celery_process is not None:
+            celery_process.terminate()
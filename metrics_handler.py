@@ -0,0 +1,76 @@
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from timing_handler import SPAN_LISTENERS
+
+
+# Метрики Prometheus (/metrics)
+# При нескольких воркерах uvicorn задается PROMETHEUS_MULTIPROC_DIR (пустая папка, очищается перед запуском):
+# воркеры пишут значения в файлы, а /metrics собирает их со всех процессов
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+# границы корзин гистограмм задержки (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Длительность обработки запроса',
+                                 ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+HTTP_EXCEPTIONS = Counter('http_exceptions_total', 'Необработанные исключения при обработке запроса', ['method', 'route'])
+PG_OPERATION_SECONDS = Histogram('pg_operation_duration_seconds', 'Длительность операции Pg (с получением соединения)',
+                                 ['operation'], buckets=LATENCY_BUCKETS)
+PG_OPERATION_ERRORS = Counter('pg_operation_errors_total', 'Ошибки операций Pg', ['operation'])
+DEPENDENCY_SECONDS = Histogram('dependency_duration_seconds', 'Длительность обращения к внешней зависимости и этапа запроса',
+                               ['dependency'], buckets=LATENCY_BUCKETS)
+DEPENDENCY_ERRORS = Counter('dependency_errors_total', 'Ошибки обращения к внешней зависимости', ['dependency'])
+LIMITER_REJECTIONS = Counter('rate_limiter_rejections_total', 'Запросы, отклоненные ограничителем частоты', ['limiter', 'route'])
+PG_POOL_CONNECTIONS = Gauge('pg_pool_connections', 'Соединения пула Постгрес', ['state'], multiprocess_mode='livesum')
+PG_POOL_WAITING = Gauge('pg_pool_waiting', 'Запросы в очереди ожидания соединения пула Постгрес', multiprocess_mode='livesum')
+
+
+def observe_span(name: str, seconds: float, failed: bool) -> None:
+    """
+    Учет замера timing_handler.span в метриках зависимостей
+    """
+    DEPENDENCY_SECONDS.labels(name).observe(seconds)
+    if failed:
+        DEPENDENCY_ERRORS.labels(name).inc()
+
+
+SPAN_LISTENERS.append(observe_span)
+
+
+def observe_pool(size: int, idle: int, waiting: int) -> None:
+    """
+    Загрузка пула соединений Постгрес текущего воркера
+    """
+    PG_POOL_CONNECTIONS.labels('in_use').set(size - idle)
+    PG_POOL_CONNECTIONS.labels('idle').set(idle)
+    PG_POOL_WAITING.set(waiting)
+
+
+def route_name(scope: dict) -> str:
+    """
+    Шаблон пути маршрута для метки (без параметров, чтобы число меток было ограничено)
+    """
+    route = scope.get('route')
+    return getattr(route, 'path', '<other>')
+
+
+def metrics_response() -> tuple[bytes, str]:
+    """
+    Метрики в текстовом формате Prometheus: всех воркеров при MULTIPROCESS, иначе текущего процесса
+    :return: (содержимое, content-type)
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """
+    Удаление значений gauge завершившегося воркера (вызывается при остановке)
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
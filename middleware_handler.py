@@ -0,0 +1,118 @@
+import json
+import logging
+import random
+import time
+from starlette.requests import cookie_parser
+from starlette.responses import RedirectResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from timing_handler import TIMINGS, server_timing
+from metrics_handler import HTTP_REQUEST_SECONDS, HTTP_EXCEPTIONS, route_name
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# страницы входа, с которых авторизованный пользователь уходит в ЛК
+SESSION_REDIRECT_PATHS = frozenset(('/lk', '/lk/login', '/lk/registration'))
+
+
+class SessionRedirectMiddleware:
+    """
+    Переадресация в ЛК со страниц входа при наличии куки user_session (ASGI-middleware)
+    Остальные запросы передаются приложению как есть, без Request и дополнительных задач
+    """
+
+    def __init__(self, app: ASGIApp, paths: frozenset[str] = SESSION_REDIRECT_PATHS, cookie: str = 'user_session',
+                 url: str = '/lk/me'):
+        self.app = app
+        self.paths = paths
+        self.cookie = cookie
+        self.url = url
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'http' and scope['path'] in self.paths:
+            for name, value in scope['headers']:
+                if name == b'cookie' and cookie_parser(value.decode('latin-1')).get(self.cookie):
+                    await RedirectResponse(url=self.url, status_code=303)(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+class ServerTimingMiddleware:
+    """
+    Замеры этапов запроса (БД, Редис, s3, jwt, bcrypt, шаблоны) в заголовке Server-Timing (ASGI-middleware)
+    В выборку попадает доля запросов TIMING_SAMPLE_RATE, остальные передаются приложению как есть
+    При TIMING_LOG замеры запроса пишутся строкой json в лог (INFO) после его завершения (с фоновыми задачами)
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float | None = None, log: bool | None = None):
+        self.app = app
+        self.sample_rate = settings.TIMING_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.log = settings.TIMING_LOG if log is None else log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not self.sample_rate or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        timings = {}
+        token = TIMINGS.set(timings)
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                header = server_timing(timings, time.perf_counter() - started)
+                message = {**message, 'headers': [*message.get('headers', ()), (b'server-timing', header.encode('latin-1'))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            TIMINGS.reset(token)
+            if self.log:
+                logger.info(json.dumps({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'status': status,
+                    'total_ms': round((time.perf_counter() - started) * 1000, 2),
+                    'timings': {name: {'ms': round(seconds * 1000, 2), 'count': count}
+                                for name, (seconds, count) in timings.items()},
+                }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Гистограмма длительности запросов по маршрутам и учет необработанных исключений (ASGI-middleware)
+    Длительность считается до отправки ответа целиком, без фоновых задач
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        observed = False
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, observed
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False) and not observed:
+                observed = True
+                HTTP_REQUEST_SECONDS.labels(scope['method'], route_name(scope), status).observe(time.perf_counter() - started)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        except Exception:
+            HTTP_EXCEPTIONS.labels(scope['method'], route_name(scope)).inc()
+            raise
+        finally:
+            if not observed:
+                HTTP_REQUEST_SECONDS.labels(scope['method'], route_name(scope), status).observe(time.perf_counter() - started)
@@ -77,6 +77,10 @@ class TaskAdd(BaseModel):
     }
 
 
+# задача массового добавления: не прошедшая проверку TaskAdd остается словарем, чтобы вернуть ее ошибки по индексу
+BulkTaskAdd = Annotated[TaskAdd | dict, Field(union_mode='left_to_right')]
+
+
 class Answer(BaseModel):
     """
     Модель ответа АПИ
@@ -95,9 +99,48 @@ class Answer(BaseModel):
         }
     }
 
+class BulkAnswer(BaseModel):
+    """
+    Модель ответа АПИ на массовое добавление задач
+    """
+    status: Annotated[bool, Field(..., description='Статус')]
+    ids: Annotated[list[int], Field(default_factory=list, description='id созданных задач в порядке запроса')]
+    errors: Annotated[list[dict], Field(default_factory=list, description='Ошибки проверки: индекс задачи и описание')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'status': True,
+                    'ids': [113, 114],
+                    'errors': [
+                        {'index': 2, 'errors': [{'type': 'string_too_short', 'loc': ['title'], 'msg': 'String should have at least 3 characters'}]}
+                    ]
+                }
+            ]
+        }
+    }
+
+
+class Task(BaseModel):
+    """
+    Модель задачи в ответах АПИ
+    """
+    id: Annotated[int, Field(..., description='id задачи')]
+    email: Annotated[str, Field(..., description='Емейл владельца')]
+    title: Annotated[str, Field(..., description='Название задачи')]
+    description: Annotated[Optional[str], Field(default=None, description='Описание задачи')]
+    status: Annotated[str, Field(..., description='Статус задачи')]
+    level: Annotated[int, Field(default=0, description='Уровень важности задачи')]
+    dt_to: Annotated[Optional[datetime.datetime], Field(default=None, description='Дедлайн задачи')]
+    dt: Annotated[datetime.datetime, Field(..., description='Дата создания')]
+    file: Annotated[Optional[str], Field(default=None, description='Прикрепленный файл')]
+
+
 class TasksList(BaseModel):
     status: Annotated[bool, Field(..., description='Статус')]
-    data: Annotated[Optional[list[dict]] | None, Field(default=None, description='Список задач')]
+    data: Annotated[Optional[list[Task]] | None, Field(default=None, description='Список задач')]
+    next_cursor: Annotated[Optional[str], Field(default=None, description='Курсор следующей страницы, None - страница последняя')]
 
     model_config = {
         "json_schema_extra": {
@@ -105,8 +148,19 @@ class TasksList(BaseModel):
                 {
                     'status': True,
                     'data': [
-                        {}
-                    ]
+                        {
+                            'id': 113,
+                            'email': 'user@example.com',
+                            'title': 'Сделать покупки',
+                            'description': 'Молоко, сыр, вино',
+                            'status': 'WAIT',
+                            'level': 1,
+                            'dt_to': '2011-11-04T00:05:23',
+                            'dt': '2011-11-01T10:00:00',
+                            'file': None
+                        }
+                    ],
+                    'next_cursor': 'MjAxMS0xMS0wMVQxMDowMDowMHwxMTM='
                 }
             ]
         }
@@ -153,3 +207,113 @@ class SetStatus(BaseModel):
             ]
         }
     }
+
+
+class BulkSetStatus(BaseModel):
+    ids: Annotated[list[int], Field(..., min_length=1, description='id задач')]
+    status: Annotated[Statuses, Field(..., description='Один из возможных статусов')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'ids': [113, 114],
+                    'status': 'ARCHIVE'
+                }
+            ]
+        }
+    }
+
+
+class BulkIds(BaseModel):
+    ids: Annotated[list[int], Field(..., min_length=1, description='id задач')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'ids': [113, 114]
+                }
+            ]
+        }
+    }
+
+
+class BulkResult(BaseModel):
+    """
+    Модель ответа АПИ на массовое изменение задач
+    """
+    status: Annotated[bool, Field(..., description='Статус')]
+    results: Annotated[dict[int, bool], Field(default_factory=dict, description='Результат по каждому id: False - задача не найдена')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'status': True,
+                    'results': {'113': True, '114': False}
+                }
+            ]
+        }
+    }
+
+
+class PresignUpload(BaseModel):
+    id: Annotated[int, Field(..., description='id задачи к которой необходимо прикрепить файл')]
+    filename: Annotated[str, Field(..., min_length=3, max_length=255, description='Имя загружаемого файла')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'id': 113,
+                    'filename': 'report.pdf'
+                }
+            ]
+        }
+    }
+
+
+class PresignConfirm(BaseModel):
+    id: Annotated[int, Field(..., description='id задачи к которой прикреплен файл')]
+    key: Annotated[str, Field(..., description='Ключ объекта из ответа на запрос ссылки загрузки')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'id': 113,
+                    'key': 't-113-a1B2c3D4e5F6.pdf'
+                }
+            ]
+        }
+    }
+
+
+class AnswerPresign(Answer):
+    """
+    Модель ответа АПИ (c подписанной ссылкой на хранилище)
+    """
+    url: Annotated[str, Field(description='Подписанная ссылка на хранилище')]
+    fields: Annotated[Optional[dict[str, str]], Field(default=None, description='Поля формы загрузки (POST multipart/form-data)')]
+    key: Annotated[str, Field(description='Ключ объекта в хранилище')]
+    expires_in: Annotated[int, Field(description='Срок действия ссылки (секунды)')]
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    'status': True,
+                    'id': 113,
+                    'url': 'http://{{ Your Domain }}:9000/tasksfiles',
+                    'fields': {
+                        'key': 'pending/t-113-a1B2c3D4e5F6.pdf',
+                        'policy': '...',
+                        'x-amz-signature': '...'
+                    },
+                    'key': 't-113-a1B2c3D4e5F6.pdf',
+                    'expires_in': 600
+                }
+            ]
+        }
+    }
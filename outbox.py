@@ -0,0 +1,104 @@
+import asyncio
+import traceback
+from email_handler import send_emails, confirm_message
+from sql_handler_v2 import Pg
+from tasks import job
+from jobs import JOB_QUEUE
+from config import settings
+
+
+class OutboxDeliveryError(Exception):
+    """Ни одно письмо пачки Outbox не отправлено"""
+    pass
+
+
+def outbox_message(kind: str, payload: dict) -> tuple[str, str, str]:
+    """
+    Письмо из задачи Outbox по ее виду
+    """
+    if kind == 'confirm_email':
+        return confirm_message(payload['recipient'], payload['username'], payload['url_confirm'])
+    raise ValueError(f'Неизвестный вид задачи Outbox: {kind}')
+
+
+@job
+async def deliver_outbox(rows: list[dict]) -> int:
+    """
+    Отправка писем пачки Outbox за одну сессию SMTP (фоновая задача Celery или очереди процесса)
+    Отправленные задачи удаляются, неотправленные возвращаются в Outbox (Pg.Outbox.fail)
+    Неудачные попытки записываются всегда, после OUTBOX_MAX_ATTEMPTS задача получает статус FAILED.
+    Если не отправлено ни одно письмо (сервер недоступен), после записи задача завершается ошибкой
+    и повторяется бэкендом задач
+    :param rows: захваченные задачи (id, kind, payload)
+    :return: количество отправленных писем
+    """
+    messages, failed = [], []
+    for row in rows:
+        try:
+            messages.append((row['id'], outbox_message(row['kind'], row['payload'])))
+        except Exception:
+            traceback.print_exc()
+            failed.append(row['id'])
+    # smtplib блокирующий, поэтому отправка в отдельном потоке
+    results = await asyncio.to_thread(send_emails, [message for _, message in messages])
+    sent = [id for (id, _), result in zip(messages, results) if result]
+    failed += [id for (id, _), result in zip(messages, results) if not result]
+    if sent:
+        await Pg.Outbox.done(sent)
+    if failed:
+        await Pg.Outbox.fail(failed, settings.OUTBOX_MAX_ATTEMPTS)
+    if messages and not sent:
+        raise OutboxDeliveryError(f'Не отправлено писем: {len(messages)}')
+    return len(sent)
+
+
+async def dispatch_once(batch_size: int) -> int:
+    """
+    Захват пачки задач Outbox и постановка ее отправки в фоновые задачи (deliver_outbox)
+    Если задачу поставить не удалось, пачка возвращается в Outbox
+    :return: количество захваченных задач
+    """
+    rows = await Pg.Outbox.claim(batch_size, settings.OUTBOX_LOCK_TIMEOUT, settings.OUTBOX_MAX_ATTEMPTS)
+    if not rows:
+        return 0
+    rows = [{'id': row['id'], 'kind': row['kind'], 'payload': row['payload']} for row in rows]
+    try:
+        await deliver_outbox.adelay(rows)
+    except Exception:
+        await Pg.Outbox.fail([row['id'] for row in rows], settings.OUTBOX_MAX_ATTEMPTS)
+        raise
+    return len(rows)
+
+
+async def run_dispatcher() -> None:
+    """
+    Обработчик Outbox: пока очередь полная - без пауз, иначе опрос раз в OUTBOX_INTERVAL
+    Обработчики не мешают друг другу (FOR UPDATE SKIP LOCKED), их можно запускать несколько
+    """
+    while True:
+        try:
+            claimed = await dispatch_once(settings.OUTBOX_BATCH_SIZE)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+            claimed = 0
+        if claimed < settings.OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(settings.OUTBOX_INTERVAL)
+
+
+async def main() -> None:
+    """
+    Отдельный процесс-обработчик Outbox, при JOB_BACKEND = asyncio письма отправляются в нем же
+    """
+    if settings.JOB_BACKEND == 'asyncio':
+        await JOB_QUEUE.start()
+    try:
+        await run_dispatcher()
+    finally:
+        await JOB_QUEUE.drain(settings.JOB_DRAIN_TIMEOUT)
+
+
+if __name__ == '__main__':
+    # python outbox.py
+    asyncio.run(main())
@@ -1,10 +1,85 @@
+import time
+import uuid
 from contextlib import asynccontextmanager
 import redis.asyncio as redis
+from redis.commands.core import AsyncScript
 from config import settings
+from timing_handler import span
+
+
+# скользящее окно неудачных проверок токена
+# KEYS[1] - окно попыток (zset), KEYS[2] - ключ блокировки
+# ARGV - текущее время (мс), окно (мс), порог, срок блокировки (мс), уникальный id попытки
+# возвращает оставшийся срок блокировки (мс), 0 - адрес не заблокирован
+AUTH_FAILURE_SCRIPT = """
+local ban = redis.call('PTTL', KEYS[2])
+if ban > 0 then
+    return ban
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, tonumber(ARGV[1]) - tonumber(ARGV[2]))
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[5])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[2], '1', 'PX', ARGV[4])
+    return tonumber(ARGV[4])
+end
+return 0
+"""
+
+# общий клиент Редис с пулом соединений, создается в lifespan приложения (init_redis)
+REDIS_CLIENT: redis.Redis | None = None
+# скрипт AUTH_FAILURE_SCRIPT общего клиента, регистрируется один раз в init_redis
+AUTH_FAILURE: AsyncScript | None = None
+
+
+def create_redis() -> redis.Redis:
+    """
+    Клиент Редис с ограниченным пулом соединений: при занятом пуле запрос ждет свободное соединение
+    """
+    pool = redis.BlockingConnectionPool.from_url(
+        settings.REDIS_URL,
+        encoding="utf8",
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+async def init_redis() -> redis.Redis:
+    """
+    Создание общего клиента Редис и регистрация его скриптов
+    """
+    global REDIS_CLIENT, AUTH_FAILURE
+    if REDIS_CLIENT is None:
+        REDIS_CLIENT = create_redis()
+        AUTH_FAILURE = REDIS_CLIENT.register_script(AUTH_FAILURE_SCRIPT)
+    return REDIS_CLIENT
+
+
+async def close_redis() -> None:
+    """
+    Закрытие общего клиента Редис и его пула соединений
+    """
+    global REDIS_CLIENT, AUTH_FAILURE
+    if REDIS_CLIENT is not None:
+        await REDIS_CLIENT.close(close_connection_pool=True)
+        REDIS_CLIENT = None
+        AUTH_FAILURE = None
 
 
 @asynccontextmanager
 async def redis_conn():
+    """
+    Общий клиент Редис, а если он не создан (тесты, скрипты, celery) - отдельный
+    """
+    if REDIS_CLIENT is not None:
+        yield REDIS_CLIENT
+        return
     connection = redis.from_url(settings.REDIS_URL, encoding="utf8", decode_responses=True)
     try:
         yield connection
@@ -22,3 +97,56 @@ async def redis_add_key(key: str, value: str, ex: int) -> None:
     """
     async with redis_conn() as r:
         await r.set(key, value, ex=ex)
+
+
+async def redis_add_keys(items: dict[str, str], ex: int) -> None:
+    """
+    Добавление нескольких ключей за один запрос (pipeline)
+    :param items: ключи и значения
+    :param ex: срок действия
+    :return:
+    """
+    async with redis_conn() as r:
+        async with r.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=ex)
+            await pipe.execute()
+
+
+async def redis_get_keys(keys: list[str]) -> list[str | None]:
+    """
+    Получение значений нескольких ключей за один запрос
+    :param keys: ключи
+    :return: значения в порядке ключей, None - ключа нет
+    """
+    async with redis_conn() as r:
+        return await r.mget(keys)
+
+
+async def redis_delete_keys(keys: list[str]) -> int:
+    """
+    Удаление нескольких ключей за один запрос
+    :param keys: ключи
+    :return: количество удаленных ключей
+    """
+    async with redis_conn() as r:
+        return await r.delete(*keys) if keys else 0
+
+
+async def redis_auth_failure(client_host: str, path: str, limit: int, window: int, ban: int) -> int:
+    """
+    Учет неудачной проверки токена одним атомарным скриптом
+    В окне хранится не больше limit попыток, ключи удаляются по истечении срока
+    :param client_host: айпи клиента
+    :param path: ссылка
+    :param limit: порог ошибок в окне
+    :param window: окно (секунды)
+    :param ban: срок блокировки (секунды)
+    :return: оставшийся срок блокировки (мс), 0 - адрес не заблокирован
+    """
+    async with redis_conn() as r, span('redis'):
+        script = AUTH_FAILURE if r is REDIS_CLIENT else r.register_script(AUTH_FAILURE_SCRIPT)
+        return int(await script(
+            keys=[f'auth-fail:{path}:{client_host}', f'auth-ban:{path}:{client_host}'],
+            args=[int(time.time() * 1000), window * 1000, limit, ban * 1000, uuid.uuid4().hex]
+        ))
@@ -1,13 +1,17 @@
+import hashlib
 from config import settings
 from datetime import timedelta
 from fastapi import Form, Cookie, HTTPException, Request, Path, status as fastapi_status, APIRouter
 from typing import Optional
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
-from encryption import hash_password, create_access_token, check_token, verify_password, TokenTypes
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, Template
+from encryption import (hash_password_async, create_access_token, check_token, verify_password_async, is_banned, TokenTypes,
+                        HashPoolBusy)
 from models import Registration, Login
 from sql_handler_v2 import Pg
-from tasks import send_email_task
+from static_handler import STATIC_ASSETS, etag_matches
+from timing_handler import span
 
 
 router = APIRouter(
@@ -16,8 +20,56 @@ router = APIRouter(
 )
 
 
-# Подключение к папке с шаблонами
-templates = Jinja2Templates(directory='templates')
+class TimedTemplate(Template):
+    """
+    Шаблон с замером отрисовки (Server-Timing)
+    """
+
+    def render(self, *args, **kwargs) -> str:
+        with span('template'):
+            return super().render(*args, **kwargs)
+
+
+# Подключение к папке с шаблонами, скомпилированные шаблоны кэшируются на диске
+templates = Jinja2Templates(env=Environment(loader=FileSystemLoader('templates'), autoescape=True,
+                                            bytecode_cache=FileSystemBytecodeCache()))
+# ссылки на статические файлы с хэшем содержимого
+templates.env.globals['static_url'] = STATIC_ASSETS.url
+templates.env.template_class = TimedTemplate
+# страницы с постоянным контекстом: имя шаблона -> контекст
+STATIC_PAGES = {
+    'index.html': {},
+    'registration.html': {'message': None},
+    'verified.html': {},
+    'login.html': {'message': None},
+}
+# отрисованные страницы: имя шаблона -> (содержимое, ETag)
+RENDERED_PAGES = {}
+# ответ при переполненном пуле хеширования паролей
+BUSY_MESSAGE = 'Сервер перегружен, попробуйте позже'
+BUSY_HEADERS = {'Retry-After': '5'}
+
+
+def prerender_pages() -> None:
+    """
+    Отрисовка страниц с постоянным контекстом (при запуске приложения)
+    """
+    for name, context in STATIC_PAGES.items():
+        content = templates.get_template(name).render(context).encode('utf-8')
+        RENDERED_PAGES[name] = (content, f'"{hashlib.sha256(content).hexdigest()[:32]}"')
+
+
+def static_page(request: Request, name: str) -> Response:
+    """
+    Отрисованная заранее страница, 304 если у клиента та же версия
+    """
+    if name not in RENDERED_PAGES:
+        prerender_pages()
+    content, etag = RENDERED_PAGES[name]
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(etag, request.headers.get('if-none-match')):
+        return Response(status_code=fastapi_status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HTMLResponse(content, headers=headers)
 
 
 @router.get('/', response_class=HTMLResponse)
@@ -26,7 +78,7 @@ async def index(request: Request):
     ## Главная страница
     Содержит кнопку регистрация и логин
     """
-    return templates.TemplateResponse(request=request, name='index.html')
+    return static_page(request, 'index.html')
 
 
 @router.get('/registration', response_class=HTMLResponse)
@@ -35,7 +87,7 @@ async def registration(request: Request):
     ## Страница регистрации пользователя
     Содержит форму с Именем, емейлом, паролем
     """
-    return templates.TemplateResponse(request=request, name='registration.html', context={'message': None})
+    return static_page(request, 'registration.html')
 
 
 @router.post('/registration')
@@ -53,19 +105,25 @@ async def handle_registration(request: Request, form: Registration = Form()):
     if user:
         return templates.TemplateResponse(request=request, name='registration.html', context={'message': 'Пользователь уже существует'})
     # создаем хэш пароля и токен пользователя
-    password_hashed = hash_password(form.password)
+    try:
+        password_hashed = await hash_password_async(form.password)
+    except HashPoolBusy:
+        return templates.TemplateResponse(request=request, name='registration.html', context={'message': BUSY_MESSAGE},
+                                          status_code=fastapi_status.HTTP_503_SERVICE_UNAVAILABLE, headers=BUSY_HEADERS)
     access_token = create_access_token(email, TokenTypes.BEARER)
     confirm_token = create_access_token(email, TokenTypes.CONFIRM)
-    # отправка почты
-    send_email_task.delay(email, form.username, f'{settings.SERVER_URL}/lk/confirm/{confirm_token}')
-    # добавляем пользователя в бд
-    await Pg.Users.add(form, password_hashed, access_token)
+    # добавляем пользователя в бд вместе с письмом подтверждения в Outbox (отправляется после сохранения)
+    await Pg.Users.add(form, password_hashed, access_token,
+                       outbox=('confirm_email', {'recipient': email, 'username': form.username,
+                                                 'url_confirm': f'{settings.SERVER_URL}/lk/confirm/{confirm_token}'}))
     # переадресовываем для первого входа в ЛК
     return templates.TemplateResponse(request=request, name='login.html', context={'message': 'Регистрация прошла успешно, войдите для продолжения.'})
 
 
 @router.get('/confirm/{confirm_code}', include_in_schema=False)
 async def confirmation_email(request: Request, confirm_code: str = Path()):
+    if is_banned(request.client.host, '/confirm'):
+        raise HTTPException(status_code=fastapi_status.HTTP_429_TOO_MANY_REQUESTS)
     user = await check_token(confirm_code, TokenTypes.CONFIRM, request.client.host, '/confirm')
     if user:
         await Pg.Users.verified_true(user['email'])
@@ -76,7 +134,7 @@ async def confirmation_email(request: Request, confirm_code: str = Path()):
 
 @router.get('/verified', include_in_schema=False)
 async def handle_verified(request: Request):
-    return templates.TemplateResponse(request=request, name='verified.html')
+    return static_page(request, 'verified.html')
 
 
 @router.get('/login', response_class=HTMLResponse, tags=['account'])
@@ -85,7 +143,7 @@ async def login(request: Request):
     ## Страница входа пользователя в ЛК
     Содержит форму с емейлом, паролем
     """
-    return templates.TemplateResponse(request=request, name='login.html', context={'message': None})
+    return static_page(request, 'login.html')
 
 
 @router.post('/login', response_class=HTMLResponse)
@@ -101,7 +159,11 @@ async def handle_login(request: Request, form: Login = Form()):
     user = await Pg.Users.get(email)
     # если такая почта есть, то делаем проверку хэша пароля
     if user:
-        verify_psw_hash = verify_password(form.password, user['psw_hash'])
+        try:
+            verify_psw_hash = await verify_password_async(form.password, user['psw_hash'])
+        except HashPoolBusy:
+            return templates.TemplateResponse(request=request, name='login.html', context={'message': BUSY_MESSAGE},
+                                              status_code=fastapi_status.HTTP_503_SERVICE_UNAVAILABLE, headers=BUSY_HEADERS)
         if verify_psw_hash:
             access_cookie = create_access_token(email, TokenTypes.COOKIE)
             # Установка куки
@@ -1,15 +1,46 @@
-from fastapi import Form, Depends, HTTPException, Request, Body, status as fastapi_status, UploadFile, File, APIRouter
+import base64
+import codecs
+import csv
+import datetime
+import io
+import json
+import traceback
+from contextlib import aclosing
+from typing import Literal, Optional
+from fastapi import (Form, Depends, HTTPException, Request, Body, Query, status as fastapi_status, UploadFile, File,
+                     APIRouter, BackgroundTasks)
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from fastapi_limiter.depends import RateLimiter
-from encryption import check_token, generate_filename, TokenTypes
-from models import Answer, TaskAdd, AnswerUrl, TasksList, SetStatus
-from io import BytesIO
-from s3_handler import upload_file, delete_file
+from pydantic import ValidationError
+from limiter_handler import rate_limiter
+from encryption import check_token, generate_filename, is_banned, TokenTypes
+from models import (Answer, BulkAnswer, BulkTaskAdd, TaskAdd, AnswerUrl, TasksList, SetStatus, Statuses, BulkSetStatus, BulkIds,
+                    BulkResult, PresignUpload, PresignConfirm, AnswerPresign)
+from json_handler import FastJSONResponse
+from s3_handler import (upload_stream, delete_file, delete_files, presign_upload, presign_download, read_file_head, move_file,
+                        UploadSizeError, PENDING_PREFIX)
 from config import settings
 from sql_handler_v2 import Pg
 
 
 UPLOAD_EXT_TYPES = ('txt', 'jpg', 'jpeg', 'png', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx')
+# сигнатуры первых байт файлов: (сигнатура, подходящие расширения, тип содержимого)
+UPLOAD_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', ('png',), 'image/png'),
+    (b'\xff\xd8\xff', ('jpg', 'jpeg'), 'image/jpeg'),
+    (b'GIF87a', ('gif',), 'image/gif'),
+    (b'GIF89a', ('gif',), 'image/gif'),
+    (b'%PDF-', ('pdf',), 'application/pdf'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', ('doc', 'xls'), 'application/x-ole-storage'),
+    (b'PK\x03\x04', ('docx', 'xlsx'), 'application/zip'),
+)
+# сколько первых байт файла читается для определения типа
+UPLOAD_SNIFF_SIZE = 2048
+# форматы выгрузки задач: тип содержимого и расширение файла
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
 
 
 # Извлечение токена из запросов
@@ -26,28 +57,146 @@ async def get_user_from_token(request: Request, token: str = Depends(oauth2_sche
     """
     Получаем пользователя из токена и проверяем его.
     """
+    if is_banned(request.client.host, '/task'):
+        raise HTTPException(status_code=fastapi_status.HTTP_429_TOO_MANY_REQUESTS, detail='Слишком много неудачных попыток')
     user = await check_token(token, TokenTypes.BEARER, request.client.host, '/task')
     if not user:
         raise HTTPException(status_code=fastapi_status.HTTP_403_FORBIDDEN, detail="Неверный токен или несуществующий пользователь")
     return user
 
 
-async def get_upload(file: UploadFile = File(description='Объект файла (BytesIO)')):
-    # считывание и проверка размера файла
-    file_ext = file.filename.split('.')[1]
-    if file.size > settings.UPLOAD_SIZE:
-        raise HTTPException(status_code=fastapi_status.HTTP_406_NOT_ACCEPTABLE, detail='Размер файла должен быть меньше 6мб')
-    elif file_ext not in UPLOAD_EXT_TYPES:
+def encode_cursor(dt: datetime.datetime, id: int) -> str:
+    """
+    Курсор страницы из ключа (dt, id) последней задачи
+    """
+    return base64.urlsafe_b64encode(f'{dt.isoformat()}|{id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """
+    Ключ (dt, id) из курсора страницы
+    """
+    try:
+        dt, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.datetime.fromisoformat(dt), int(id)
+    except Exception:
+        raise HTTPException(status_code=fastapi_status.HTTP_400_BAD_REQUEST, detail='Неверный курсор')
+
+
+def export_value(value):
+    """
+    Значение поля задачи для выгрузки
+    """
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+async def export_tasks(email: str, format: str):
+    """
+    Выгрузка задач пользователя пачками в NDJSON или CSV
+    Следующая пачка читается из БД только после отправки предыдущей, соединение между пачками не удерживается
+    """
+    header = True
+    try:
+        async with aclosing(Pg.Tasks.iter_all(email, settings.TASKS_EXPORT_BATCH)) as batches:
+            async for rows in batches:
+                if format == 'csv':
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    if header:
+                        writer.writerow(rows[0].keys())
+                        header = False
+                    writer.writerows([export_value(v) for v in row.values()] for row in rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(json.dumps({k: export_value(v) for k, v in row.items()}, ensure_ascii=False) + '\n'
+                                  for row in rows)
+    except Exception:
+        # заголовки уже отправлены: ошибка пробрасывается, чтобы передача оборвалась, а не выглядела завершенной
+        traceback.print_exc()
+        raise
+
+
+def filename_from_file(file: str) -> str:
+    """
+    Имя файла в s3 из поля file задачи: ключ объекта или ссылка на скачивание
+    """
+    return file.split('=')[1] if '=' in file else file
+
+
+def file_ext_from_name(filename: str) -> str:
+    """
+    Расширение файла из имени, если оно разрешено для загрузки
+    """
+    file_ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if file_ext not in UPLOAD_EXT_TYPES:
         raise HTTPException(status_code=fastapi_status.HTTP_406_NOT_ACCEPTABLE, detail='Разрешены только текстовые файлы и изображения')
-    file_content = await file.read()
-    file_object = BytesIO(file_content)
+    return file_ext
+
+
+async def get_user_task(user: dict, id: int) -> dict:
+    """
+    Задача пользователя по id
+    """
+    task_dict = await Pg.Tasks.get(id)
+    if not task_dict or task_dict['email'] != user['email']:
+        raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='Такая задача не найдена')
+    return task_dict
+
+
+async def cleanup_files(filenames: list[str]) -> None:
+    """
+    Удаление файлов удаленных задач из s3 (фоновая задача)
+    """
+    await delete_files(filenames)
+
+
+def check_bulk_size(ids: list[int]) -> list[int]:
+    """
+    Проверка размера пачки id, повторы убираются
+    """
+    if len(ids) > settings.TASKS_BULK_MAX:
+        raise HTTPException(status_code=fastapi_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'Не больше {settings.TASKS_BULK_MAX} задач за запрос')
+    return list(dict.fromkeys(ids))
+
+
+def sniff_file_type(head: bytes, file_ext: str) -> str | None:
+    """
+    Определение типа файла по первым байтам
+    :param head: первые байты файла
+    :param file_ext: расширение из имени файла
+    :return: тип содержимого, если первые байты соответствуют расширению, иначе None
+    """
+    for signature, exts, content_type in UPLOAD_SIGNATURES:
+        if head.startswith(signature):
+            return content_type if file_ext in exts else None
+    if file_ext != 'txt' or b'\x00' in head:
+        return None
+    try:
+        # последний символ мог обрезаться на границе чтения
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return None
+    return 'text/plain; charset=utf-8'
+
+
+async def get_upload(file: UploadFile = File(description='Объект файла (BytesIO)')):
+    # проверка размера файла, если он известен заранее, и расширения
+    if file.size is not None and file.size > settings.UPLOAD_SIZE:
+        raise HTTPException(status_code=fastapi_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Размер файла должен быть меньше 6мб')
+    file_ext = file_ext_from_name(file.filename)
+    # проверка типа по первым байтам, файл целиком не считывается
+    content_type = sniff_file_type(await file.read(UPLOAD_SNIFF_SIZE), file_ext)
+    await file.seek(0)
+    if content_type is None:
+        raise HTTPException(status_code=fastapi_status.HTTP_406_NOT_ACCEPTABLE, detail='Содержимое файла не соответствует расширению')
     # сгенерировать имя файлу
     new_filename = f'{generate_filename(12)}.{file_ext}'
-    return {'file_object': file_object, 'new_filename': new_filename}
+    return {'file': file, 'new_filename': new_filename, 'content_type': content_type}
 
 
 @router.post('/', status_code=fastapi_status.HTTP_201_CREATED,
-         dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+         dependencies=[Depends(rate_limiter(times=5, minutes=1))],
          summary='Добавление задачи',
          response_description='Успешное добавление - возврат статуса и идентификатора')
 async def task_add(user: dict = Depends(get_user_from_token),
@@ -68,8 +217,46 @@ async def task_add(user: dict = Depends(get_user_from_token),
     return Answer(status=True, id=data['id'])
 
 
+@router.post('/bulk', status_code=fastapi_status.HTTP_201_CREATED,
+         dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+         summary='Массовое добавление задач',
+         response_description='Успешное добавление - возврат id задач в порядке запроса')
+async def task_add_bulk(user: dict = Depends(get_user_from_token),
+                        items: list[BulkTaskAdd] = Body(description='Список задач в формате добавления задачи'),
+                        partial: bool = Query(False, description='Добавить корректные задачи, если часть не прошла проверку')
+                        ) -> BulkAnswer:
+    """
+    ## Массовое добавление задач
+    Все задачи проверяются и добавляются одним запросом в одной транзакции:
+       * items - список задач с полями title, description, level, dt_to
+       * partial - при ошибках проверки добавить остальные задачи и вернуть ошибки,
+         иначе не добавлять ничего. Если корректных задач нет, ничего не добавляется и возвращаются ошибки
+    """
+    if len(items) > settings.TASKS_BULK_MAX:
+        raise HTTPException(status_code=fastapi_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'Не больше {settings.TASKS_BULK_MAX} задач за запрос')
+    # задачи уже проверены при разборе тела, ошибки собираются только для не прошедших проверку
+    tasks, errors = [], []
+    for index, item in enumerate(items):
+        if isinstance(item, TaskAdd):
+            tasks.append(item)
+            continue
+        try:
+            TaskAdd.model_validate(item)
+        except ValidationError as e:
+            errors.append({'index': index, 'errors': e.errors(include_url=False, include_context=False)})
+    if (errors and not partial) or not tasks:
+        raise HTTPException(status_code=fastapi_status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=errors or 'Список задач пуст')
+    # добавление задач в бд
+    ids = await Pg.Tasks.add_many(user['email'], tasks)
+    if ids is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_400_BAD_REQUEST)
+    return BulkAnswer(status=True, ids=ids, errors=errors)
+
+
 @router.post('/uploadfile', status_code=fastapi_status.HTTP_200_OK,
-          dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+          dependencies=[Depends(rate_limiter(times=5, minutes=1))],
           summary='Загрузка файла',
           response_description='Успешное добавление - обновление задачи, возврат ссылки на файл')
 async def get_file(user: dict = Depends(get_user_from_token), file_dict = Depends(get_upload),
@@ -87,7 +274,10 @@ async def get_file(user: dict = Depends(get_user_from_token), file_dict = Depend
         raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='id задачи не найден')
     # выгрузка файла в s3
     full_new_filename = f't-{id}-{file_dict["new_filename"]}'
-    status = await upload_file(file_dict['file_object'], full_new_filename)
+    try:
+        status = await upload_stream(file_dict['file'], full_new_filename, settings.UPLOAD_SIZE, file_dict['content_type'])
+    except UploadSizeError:
+        raise HTTPException(status_code=fastapi_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Размер файла должен быть меньше 6мб')
     if status is False:
         raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Ошибка добавления файла на сервер')
     # сделать запись ссылки на файл в бд
@@ -96,8 +286,84 @@ async def get_file(user: dict = Depends(get_user_from_token), file_dict = Depend
     return AnswerUrl(status=True, id=id, url=url)
 
 
+@router.post('/presign/upload', status_code=fastapi_status.HTTP_200_OK,
+          dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+          summary='Форма для загрузки файла в хранилище',
+          response_description='Подписанная форма POST и ключ объекта')
+async def presign_file_upload(user: dict = Depends(get_user_from_token), item: PresignUpload = Body()) -> AnswerPresign:
+    """
+    ## Форма для прямой загрузки файла в хранилище
+    Файл загружается клиентом запросом POST (multipart/form-data) по ссылке url с полями fields и файлом в поле file.
+    Хранилище не примет файл больше допустимого размера. Загрузку нужно подтвердить в /task/presign/confirm,
+    неподтвержденные файлы удаляются:
+        * id - id задачи к которой необходимо прикрепить файл
+        * filename - имя загружаемого файла
+    """
+    task_dict = await get_user_task(user, item.id)
+    if task_dict['file']:
+        raise HTTPException(status_code=fastapi_status.HTTP_409_CONFLICT, detail='К задаче уже прикреплен файл')
+    key = f't-{item.id}-{generate_filename(12)}.{file_ext_from_name(item.filename)}'
+    form = await presign_upload(PENDING_PREFIX + key, settings.S3_PRESIGN_EXPIRES, settings.UPLOAD_SIZE)
+    if form is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return AnswerPresign(status=True, id=item.id, url=form['url'], fields=form['fields'], key=key,
+                         expires_in=settings.S3_PRESIGN_EXPIRES)
+
+
+@router.post('/presign/confirm', status_code=fastapi_status.HTTP_200_OK,
+          dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+          summary='Подтверждение загрузки файла',
+          response_description='Файл прикреплен к задаче')
+async def presign_file_confirm(user: dict = Depends(get_user_from_token), item: PresignConfirm = Body()) -> Answer:
+    """
+    ## Подтверждение прямой загрузки файла
+    Проверяются размер и тип загруженного файла, файл переносится из неподтвержденных и записывается в задачу:
+        * id - id задачи
+        * key - ключ объекта из ответа /task/presign/upload
+    """
+    if not item.key.startswith(f't-{item.id}-'):
+        raise HTTPException(status_code=fastapi_status.HTTP_400_BAD_REQUEST, detail='Ключ не относится к задаче')
+    task_dict = await get_user_task(user, item.id)
+    if task_dict['file']:
+        raise HTTPException(status_code=fastapi_status.HTTP_409_CONFLICT, detail='К задаче уже прикреплен файл')
+    pending_key = PENDING_PREFIX + item.key
+    file_head = await read_file_head(pending_key, UPLOAD_SNIFF_SIZE)
+    if file_head is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if file_head is None:
+        raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='Файл не загружен')
+    head, size = file_head
+    if size > settings.UPLOAD_SIZE or sniff_file_type(head, file_ext_from_name(item.key)) is None:
+        await delete_file(pending_key)
+        raise HTTPException(status_code=fastapi_status.HTTP_406_NOT_ACCEPTABLE, detail='Недопустимый размер или тип файла')
+    if not await move_file(pending_key, item.key):
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    await Pg.Tasks.upd(user['email'], item.id, {'file': item.key})
+    return Answer(status=True, id=item.id)
+
+
+@router.get('/presign/download', status_code=fastapi_status.HTTP_200_OK,
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+            summary='Ссылка для скачивания файла',
+            response_description='Подписанная ссылка GET')
+async def presign_file_download(user: dict = Depends(get_user_from_token),
+                                id: int = Query(description='id задачи, файл которой необходимо скачать')) -> AnswerPresign:
+    """
+    ## Ссылка для прямого скачивания файла задачи из хранилища
+        * id - id задачи
+    """
+    task_dict = await get_user_task(user, id)
+    if not task_dict['file']:
+        raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='Файл у данной задачи не найден')
+    key = filename_from_file(task_dict['file'])
+    url = await presign_download(key, settings.S3_PRESIGN_EXPIRES)
+    if url is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return AnswerPresign(status=True, id=id, url=url, key=key, expires_in=settings.S3_PRESIGN_EXPIRES)
+
+
 @router.delete('/uploadfile', status_code=fastapi_status.HTTP_200_OK,
-            dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
             summary='Удаление файла',
             response_description='Файл успешно удален')
 async def del_file(user: dict = Depends(get_user_from_token),
@@ -115,7 +381,7 @@ async def del_file(user: dict = Depends(get_user_from_token),
         raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='Файл у данной задачи не найден')
     # получение имени файла из ссылки в БД
     try:
-        filename = task_dict['file'].split('=')[1]
+        filename = filename_from_file(task_dict['file'])
     except Exception:
         raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
     # операция удаления в s3
@@ -128,19 +394,58 @@ async def del_file(user: dict = Depends(get_user_from_token),
 
 
 @router.get('/', status_code=fastapi_status.HTTP_200_OK,
-            dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+            response_model=TasksList,
             summary='Получение списка задач',
             response_description='Успешный запрос')
-async def task_get_all(user: dict = Depends(get_user_from_token)) -> TasksList:
+async def task_get_all(user: dict = Depends(get_user_from_token),
+                       limit: int = Query(settings.TASKS_PAGE_SIZE, ge=1, le=settings.TASKS_PAGE_MAX, description='Размер страницы'),
+                       cursor: Optional[str] = Query(None, description='Курсор следующей страницы из предыдущего ответа'),
+                       status: Optional[Statuses] = Query(None, description='Фильтр по статусу'),
+                       level: Optional[int] = Query(None, ge=0, le=3, description='Фильтр по уровню важности'),
+                       dt_to_from: Optional[datetime.datetime] = Query(None, description='Дедлайн не раньше'),
+                       dt_to_till: Optional[datetime.datetime] = Query(None, description='Дедлайн раньше')
+                       ) -> FastJSONResponse:
     """
-    ## Получение списка всех задач
+    ## Получение списка задач
+    Задачи отдаются страницами в порядке создания:
+        * limit - размер страницы
+        * cursor - next_cursor из предыдущего ответа
+        * status, level, dt_to_from, dt_to_till - фильтры
     """
-    tasks_list = await Pg.Tasks.get_all(user['email'])
-    return TasksList(status=True, data=tasks_list)
+    after = decode_cursor(cursor) if cursor else None
+    tasks_list = await Pg.Tasks.get_page(user['email'], limit + 1, after,
+                                         status.value if status else None, level, dt_to_from, dt_to_till)
+    if tasks_list is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    # лишняя запись означает, что есть следующая страница
+    next_cursor = None
+    if len(tasks_list) > limit:
+        tasks_list = tasks_list[:limit]
+        next_cursor = encode_cursor(tasks_list[-1]['dt'], tasks_list[-1]['id'])
+    # строки БД сериализуются напрямую, без проверки моделью TasksList
+    return FastJSONResponse({'status': True, 'data': tasks_list, 'next_cursor': next_cursor})
+
+
+@router.get('/export', status_code=fastapi_status.HTTP_200_OK,
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+            summary='Выгрузка всех задач',
+            response_description='Файл NDJSON или CSV со всеми задачами')
+async def task_export(user: dict = Depends(get_user_from_token),
+                      format: Literal['ndjson', 'csv'] = Query('ndjson', description='Формат выгрузки')
+                      ) -> StreamingResponse:
+    """
+    ## Выгрузка всех задач
+    Задачи передаются потоком, без загрузки всего списка в память:
+        * format - ndjson (по строке JSON на задачу) или csv
+    """
+    media_type, ext = EXPORT_FORMATS[format]
+    return StreamingResponse(export_tasks(user['email'], format), media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="tasks.{ext}"'})
 
 
 @router.delete('/', status_code=fastapi_status.HTTP_200_OK,
-            dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
             summary='Удаление задачи',
             response_description='Успешно удалена')
 async def task_delete(user: dict = Depends(get_user_from_token),
@@ -161,7 +466,7 @@ async def task_delete(user: dict = Depends(get_user_from_token),
 
 
 @router.patch('/', status_code=fastapi_status.HTTP_200_OK,
-            dependencies=[Depends(RateLimiter(times=5, minutes=1))],
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
             summary='Обновление статуса',
             response_description='Статус успешно обновлен')
 async def task_set_status(user: dict = Depends(get_user_from_token), set_status: SetStatus = Body()) -> Answer:
@@ -174,5 +479,47 @@ async def task_set_status(user: dict = Depends(get_user_from_token), set_status:
     if task_dict['email'] != user['email']:
         raise HTTPException(status_code=fastapi_status.HTTP_404_NOT_FOUND, detail='Такая задача не найдена')
     # обновление статуса задачи в БД
-    await Pg.Tasks.upd(user['email'], set_status.id, {'status': set_status.status})
+    await Pg.Tasks.upd(user['email'], set_status.id, {'status': set_status.status.value})
     return Answer(status=True, id=set_status.id)
+
+
+@router.patch('/bulk', status_code=fastapi_status.HTTP_200_OK,
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+            summary='Массовое обновление статуса',
+            response_description='Результат обновления по каждой задаче')
+async def task_set_status_bulk(user: dict = Depends(get_user_from_token), set_status: BulkSetStatus = Body()) -> BulkResult:
+    """
+    ## Обновление статуса списка задач
+    Все задачи обновляются одним запросом, чужие и несуществующие id пропускаются:
+        * ids - id задач
+        * status - один из возможных статусов
+    """
+    ids = check_bulk_size(set_status.ids)
+    updated = await Pg.Tasks.set_status_many(user['email'], ids, set_status.status.value)
+    if updated is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    updated = set(updated)
+    return BulkResult(status=True, results={id: id in updated for id in ids})
+
+
+@router.delete('/bulk', status_code=fastapi_status.HTTP_200_OK,
+            dependencies=[Depends(rate_limiter(times=5, minutes=1))],
+            summary='Массовое удаление задач',
+            response_description='Результат удаления по каждой задаче')
+async def task_delete_bulk(background_tasks: BackgroundTasks, user: dict = Depends(get_user_from_token),
+                           delete: BulkIds = Body()) -> BulkResult:
+    """
+    ## Удаление списка задач
+    Все задачи удаляются одним запросом, чужие и несуществующие id пропускаются,
+    прикрепленные файлы удаляются из хранилища после ответа:
+        * ids - id задач
+    """
+    ids = check_bulk_size(delete.ids)
+    deleted = await Pg.Tasks.delete_many(user['email'], ids)
+    if deleted is False:
+        raise HTTPException(status_code=fastapi_status.HTTP_500_INTERNAL_SERVER_ERROR)
+    filenames = [filename_from_file(row['file']) for row in deleted if row['file']]
+    if filenames:
+        background_tasks.add_task(cleanup_files, filenames)
+    deleted_ids = {row['id'] for row in deleted}
+    return BulkResult(status=True, results={id: id in deleted_ids for id in ids})
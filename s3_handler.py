@@ -1,48 +1,296 @@
-from io import BytesIO
+import time
 import aioboto3
-from contextlib import asynccontextmanager
+from aiobotocore.config import AioConfig
+from contextlib import asynccontextmanager, AsyncExitStack
 import traceback
+from botocore.exceptions import ClientError
 from config import settings
+from timing_handler import record
+
+
+# размер части multipart-загрузки (минимум s3 для всех частей, кроме последней)
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+# максимум ключей в одном запросе delete_objects
+DELETE_BATCH_SIZE = 1000
+# префикс загрузок по подписанной форме до подтверждения, неподтвержденные удаляются правилом жизненного цикла
+PENDING_PREFIX = 'pending/'
+PENDING_RULE_ID = 'expire-pending-uploads'
+
+
+# общий клиент s3, создается в lifespan приложения (init_client)
+S3_CLIENT = None
+S3_CLIENT_STACK: AsyncExitStack | None = None
+# задержки вызовов s3 по операциям: количество, сумма и максимум (секунды)
+S3_LATENCY = {}
+
+
+class UploadSizeError(Exception):
+    """Файл больше допустимого размера"""
+    pass
+
+
+def before_call(context: dict, **kwargs) -> None:
+    context['started'] = time.perf_counter()
+
+
+def after_call(model, context: dict, http_response=None, **kwargs) -> None:
+    """
+    Учет задержки вызова s3 (событие botocore after-call)
+    """
+    started = context.get('started')
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    record('s3', duration, http_response is not None and http_response.status_code >= 400)
+    stats = S3_LATENCY.setdefault(model.name, {'count': 0, 'total': 0.0, 'max': 0.0})
+    stats['count'] += 1
+    stats['total'] += duration
+    stats['max'] = max(stats['max'], duration)
+
+
+def s3_stats() -> dict:
+    """
+    Средняя и максимальная задержка вызовов s3 по операциям (мс)
+    """
+    return {name: {'count': v['count'], 'avg_ms': round(v['total'] / v['count'] * 1000, 2), 'max_ms': round(v['max'] * 1000, 2)}
+            for name, v in S3_LATENCY.items()}
+
+
+def create_client():
+    """
+    Клиент s3 с пулом соединений keep-alive и учетом задержек вызовов
+    """
+    session = aioboto3.Session()
+    return session.client('s3',
+                          endpoint_url=f'http://{settings.HOST}:9000',  # URL MinIO
+                          aws_access_key_id=settings.S3_ACCESS,  # Твой ключ доступа
+                          aws_secret_access_key=settings.S3_SECRET,  # Твой секретный ключ
+                          region_name='us-east-1',
+                          config=AioConfig(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                                           connect_timeout=settings.S3_CONNECT_TIMEOUT,
+                                           read_timeout=settings.S3_READ_TIMEOUT,
+                                           connector_args={'keepalive_timeout': settings.S3_KEEPALIVE_TIMEOUT}))
+
+
+async def init_client() -> None:
+    """
+    Открытие общего клиента s3
+    """
+    global S3_CLIENT, S3_CLIENT_STACK
+    if S3_CLIENT is None:
+        S3_CLIENT_STACK = AsyncExitStack()
+        S3_CLIENT = await S3_CLIENT_STACK.enter_async_context(create_client())
+        S3_CLIENT.meta.events.register('before-call.s3', before_call)
+        S3_CLIENT.meta.events.register('after-call.s3', after_call)
+
+
+async def close_client() -> None:
+    """
+    Закрытие общего клиента s3 и его соединений
+    """
+    global S3_CLIENT, S3_CLIENT_STACK
+    if S3_CLIENT_STACK is not None:
+        await S3_CLIENT_STACK.aclose()
+        S3_CLIENT, S3_CLIENT_STACK = None, None
 
 
 @asynccontextmanager
 async def init_connection():
-    session = aioboto3.Session()
-    async with session.client('s3',
-                        endpoint_url=f'http://{settings.HOST}:9000',  # URL MinIO
-                        aws_access_key_id=settings.S3_ACCESS,  # Твой ключ доступа
-                        aws_secret_access_key=settings.S3_SECRET,  # Твой секретный ключ
-                        region_name='us-east-1') as s3:
+    """
+    Общий клиент s3, а если он не открыт (тесты, скрипты) - отдельный
+    """
+    if S3_CLIENT is not None:
+        yield S3_CLIENT
+        return
+    async with create_client() as s3:
         yield s3
 
 
-async def upload_file(file: BytesIO, filename):
+async def upload_stream(file, filename: str, max_size: int, content_type: str = 'application/octet-stream') -> bool:
+    """
+    Потоковая загрузка файла в s3: в памяти держится одна часть UPLOAD_CHUNK_SIZE
+    Файл меньше части загружается одним put_object, больше - multipart-загрузкой
+    :param file: объект с асинхронным read(size), например UploadFile
+    :param filename: ключ объекта
+    :param max_size: допустимый размер файла, проверяется по мере чтения
+    :param content_type: тип содержимого
+    :raise UploadSizeError: файл больше max_size, загрузка отменена
+    :return: True | False
+    """
+    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    if len(chunk) > max_size:
+        raise UploadSizeError()
+    try:
+        async with init_connection() as s3:
+            if len(chunk) < UPLOAD_CHUNK_SIZE:
+                await s3.put_object(Bucket=settings.BUCKET_NAME, Key=filename, Body=chunk, ContentType=content_type)
+                return True
+            upload = await s3.create_multipart_upload(Bucket=settings.BUCKET_NAME, Key=filename, ContentType=content_type)
+            upload_id = upload['UploadId']
+            try:
+                parts, size = [], 0
+                while chunk:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise UploadSizeError()
+                    response = await s3.upload_part(Bucket=settings.BUCKET_NAME, Key=filename, UploadId=upload_id,
+                                                    PartNumber=len(parts) + 1, Body=chunk)
+                    parts.append({'ETag': response['ETag'], 'PartNumber': len(parts) + 1})
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                await s3.complete_multipart_upload(Bucket=settings.BUCKET_NAME, Key=filename, UploadId=upload_id,
+                                                   MultipartUpload={'Parts': parts})
+                return True
+            except BaseException:
+                await s3.abort_multipart_upload(Bucket=settings.BUCKET_NAME, Key=filename, UploadId=upload_id)
+                raise
+    except UploadSizeError:
+        raise
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+async def init_pending_lifecycle() -> bool:
+    """
+    Правило жизненного цикла бакета: объекты PENDING_PREFIX удаляются через S3_PENDING_EXPIRE_DAYS
+    Остальные правила бакета сохраняются
+    """
+    rule = {'ID': PENDING_RULE_ID, 'Status': 'Enabled', 'Filter': {'Prefix': PENDING_PREFIX},
+            'Expiration': {'Days': settings.S3_PENDING_EXPIRE_DAYS},
+            'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': settings.S3_PENDING_EXPIRE_DAYS}}
+    try:
+        async with init_connection() as s3:
+            try:
+                response = await s3.get_bucket_lifecycle_configuration(Bucket=settings.BUCKET_NAME)
+                rules = [r for r in response.get('Rules', []) if r.get('ID') != PENDING_RULE_ID]
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+                    raise
+                rules = []
+            await s3.put_bucket_lifecycle_configuration(Bucket=settings.BUCKET_NAME,
+                                                        LifecycleConfiguration={'Rules': rules + [rule]})
+            return True
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+async def presign_upload(object_key: str, expires: int, max_size: int) -> dict | bool:
+    """
+    Подписанная форма для загрузки объекта напрямую в s3 (POST multipart/form-data)
+    Размер ограничен условием content-length-range политики: файл больше max_size s3 не примет
+    :return: {'url': ссылка, 'fields': поля формы} | False
+    """
+    try:
+        async with init_connection() as s3:
+            return await s3.generate_presigned_post(settings.BUCKET_NAME, object_key,
+                                                    Conditions=[['content-length-range', 0, max_size]], ExpiresIn=expires)
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+async def move_file(source_key: str, object_key: str) -> bool:
+    """
+    Перенос объекта внутри бакета (копирование на стороне s3 и удаление исходного)
+    """
     try:
         async with init_connection() as s3:
-            response = await s3.upload_fileobj(file, settings.BUCKET_NAME, filename)
-            print(response)
+            await s3.copy_object(Bucket=settings.BUCKET_NAME, Key=object_key,
+                                 CopySource={'Bucket': settings.BUCKET_NAME, 'Key': source_key})
+            await s3.delete_object(Bucket=settings.BUCKET_NAME, Key=source_key)
             return True
     except Exception:
         traceback.print_exc()
         return False
 
 
+async def presign_download(object_key: str, expires: int) -> str | bool:
+    """
+    Подписанная ссылка для скачивания объекта напрямую из s3 (GET)
+    """
+    try:
+        async with init_connection() as s3:
+            return await s3.generate_presigned_url('get_object', Params={'Bucket': settings.BUCKET_NAME, 'Key': object_key},
+                                                   ExpiresIn=expires)
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+async def read_file_head(object_key: str, size: int) -> tuple[bytes, int] | None | bool:
+    """
+    Первые байты объекта и его полный размер одним запросом (GET с Range)
+    :return: (первые байты, размер) | None - объекта нет | False - ошибка
+    """
+    try:
+        async with init_connection() as s3:
+            try:
+                response = await s3.get_object(Bucket=settings.BUCKET_NAME, Key=object_key, Range=f'bytes=0-{size - 1}')
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code')
+                if code in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                # диапазон не применим только к пустому объекту
+                if code == 'InvalidRange':
+                    return b'', 0
+                raise
+            async with response['Body'] as body:
+                head = await body.read()
+            content_range = response.get('ContentRange')
+            total = int(content_range.rsplit('/', 1)[1]) if content_range else len(head)
+            return head, total
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+async def file_exists(s3, object_key: str) -> bool:
+    """
+    Проверка наличия объекта запросом HEAD, без загрузки содержимого
+    """
+    try:
+        await s3.head_object(Bucket=settings.BUCKET_NAME, Key=object_key)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
 async def delete_file(object_key: str) -> bool:
     try:
         async with init_connection() as s3:
             # проверка наличия объекта
-            try:
-                response = await s3.get_object(Bucket=settings.BUCKET_NAME, Key=object_key)
-            except s3.exceptions.NoSuchKey:
+            if not await file_exists(s3, object_key):
                 return False
-            # удаление
+            # удаление, s3 строго согласован - повторная проверка не нужна
             await s3.delete_object(Bucket=settings.BUCKET_NAME, Key=object_key)
-            # проверка наличия после удаления
-            try:
-                response = await s3.get_object(Bucket=settings.BUCKET_NAME, Key=object_key)
-                print(response)
-            except s3.exceptions.NoSuchKey:
-                return True
+            return True
     except Exception:
         traceback.print_exc()
         return False
+
+
+async def delete_files(object_keys: list[str]) -> dict[str, bool]:
+    """
+    Удаление списка объектов пачками по DELETE_BATCH_SIZE за запрос
+    :param object_keys: ключи объектов
+    :return: результат по каждому ключу, отсутствующие объекты считаются удаленными
+    """
+    result = dict.fromkeys(object_keys, True)
+    keys = list(result)
+    start = 0
+    try:
+        async with init_connection() as s3:
+            for start in range(0, len(keys), DELETE_BATCH_SIZE):
+                batch = keys[start:start + DELETE_BATCH_SIZE]
+                response = await s3.delete_objects(Bucket=settings.BUCKET_NAME,
+                                                   Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+                for error in response.get('Errors', []):
+                    result[error['Key']] = False
+    except Exception:
+        traceback.print_exc()
+        for key in keys[start:]:
+            result[key] = False
+    return result
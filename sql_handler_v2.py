@@ -1,33 +1,236 @@
 import asyncio
 import datetime
+import functools
+import json
+import time
 import traceback
+from contextlib import asynccontextmanager
 import asyncpg
+from cache_handler import USERS_CACHE, invalidate_user
 from models import TaskAdd, Registration
+from timing_handler import span
+from metrics_handler import PG_OPERATION_SECONDS, PG_OPERATION_ERRORS, observe_pool
 from config import settings
 
 
 SETTINGS = settings
 
+# реестр фиксированных запросов: подготавливаются один раз на каждом соединении
+STATEMENTS = {
+    'users_add': '''
+        INSERT INTO Users (email, psw_hash, name, token, status, dt)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING email;
+    ''',
+    'users_get_all': 'SELECT * FROM Users;',
+    'users_get': 'SELECT * FROM Users WHERE email = $1;',
+    'users_verified_true': '''
+        UPDATE Users
+        SET verified = TRUE
+        WHERE email = $1
+        RETURNING email;
+    ''',
+    'tasks_add': '''
+        INSERT INTO Tasks (email, title, description, status, level, dt_to, dt)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        RETURNING id;
+    ''',
+    'tasks_add_many': '''
+        INSERT INTO Tasks (email, title, description, status, level, dt_to, dt)
+        SELECT $1, t.title, t.description, 'WAIT', t.level, t.dt_to, $2
+        FROM unnest($3::text[], $4::text[], $5::int[], $6::timestamp[])
+            WITH ORDINALITY AS t(title, description, level, dt_to, n)
+        ORDER BY t.n
+        RETURNING id;
+    ''',
+    'tasks_get_all': 'SELECT * FROM Tasks WHERE email = $1;',
+    'tasks_get': 'SELECT * FROM Tasks WHERE id = $1;',
+    'tasks_set_status_many': '''
+        UPDATE Tasks
+        SET status = $3
+        WHERE email = $1 AND id = ANY($2::int[])
+        RETURNING id;
+    ''',
+    'tasks_delete_many': '''
+        DELETE FROM Tasks
+        WHERE email = $1 AND id = ANY($2::int[])
+        RETURNING id, file;
+    ''',
+    'outbox_add': '''
+        INSERT INTO Outbox (kind, payload, dt)
+        VALUES ($1, $2::jsonb, $3)
+        RETURNING id;
+    ''',
+    'outbox_claim': '''
+        UPDATE Outbox
+        SET status = 'SENDING', attempts = attempts + 1, locked_dt = $2
+        WHERE id IN (
+            SELECT id
+            FROM Outbox
+            WHERE status = 'NEW' OR (status = 'SENDING' AND locked_dt < $3 AND attempts < $4)
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, payload, attempts;
+    ''',
+    'outbox_expire': '''
+        UPDATE Outbox
+        SET status = 'FAILED', locked_dt = NULL
+        WHERE status = 'SENDING' AND locked_dt < $1 AND attempts >= $2;
+    ''',
+    'outbox_done': 'DELETE FROM Outbox WHERE id = ANY($1::int[]);',
+    'outbox_fail': '''
+        UPDATE Outbox
+        SET status = CASE WHEN attempts >= $2 THEN 'FAILED' ELSE 'NEW' END, locked_dt = NULL
+        WHERE id = ANY($1::int[]);
+    ''',
+    'tasks_delete': '''
+        DELETE FROM Tasks
+        WHERE id = $1
+        RETURNING id;
+    ''',
+}
+
+# индексы под постраничную выдачу задач по ключу (dt, id) и фильтры
+TASKS_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS tasks_email_dt_id_idx ON Tasks (email, dt, id);',
+    'CREATE INDEX IF NOT EXISTS tasks_email_status_dt_id_idx ON Tasks (email, status, dt, id);',
+    'CREATE INDEX IF NOT EXISTS tasks_email_level_dt_id_idx ON Tasks (email, level, dt, id);',
+)
+
+# очередь исходящих задач (писем), пишется в одной транзакции с данными
+OUTBOX_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS Outbox (
+        id SERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'NEW',
+        attempts INT NOT NULL DEFAULT 0,
+        dt TIMESTAMP NOT NULL,
+        locked_dt TIMESTAMP
+    );
+    ''',
+    "CREATE INDEX IF NOT EXISTS outbox_pending_idx ON Outbox (id) WHERE status IN ('NEW', 'SENDING');",
+)
+
+
+class PgConnection(asyncpg.Connection):
+    """
+    Соединение для запросов из реестра STATEMENTS
+    Запросы выполняются через кэш подготовленных запросов соединения (statement_cache_size asyncpg):
+    каждый подготавливается на соединении один раз и переиспользуется после возврата соединения в пул
+    """
+    __slots__ = ()
+
+
+# общий пул соединений, создается в lifespan приложения (init_pool)
+POOL: asyncpg.Pool | None = None
+# счетчики ожидания соединений из пула
+POOL_STATS = {'waiting': 0, 'max_waiting': 0, 'acquired': 0, 'timeouts': 0}
+
+
+async def init_pool() -> asyncpg.Pool:
+    """
+    Создание общего пула соединений БД Постгрес
+    """
+    global POOL
+    if POOL is None:
+        POOL = await asyncpg.create_pool(
+            settings.POSTGRES_URL,
+            min_size=settings.PG_POOL_MIN_SIZE,
+            max_size=settings.PG_POOL_MAX_SIZE,
+            max_queries=settings.PG_POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=settings.PG_POOL_MAX_INACTIVE_LIFETIME,
+            connection_class=PgConnection
+        )
+    return POOL
+
+
+async def close_pool() -> None:
+    """
+    Закрытие общего пула соединений
+    """
+    global POOL
+    if POOL is not None:
+        await POOL.close()
+        POOL = None
+
+
+def pool_stats() -> dict:
+    """
+    Статистика загрузки пула для подбора размера на воркер
+    :return: размеры пула, занятые соединения, очередь ожидания
+    """
+    if POOL is None:
+        return {'enabled': False, **POOL_STATS}
+    size, idle, max_size = POOL.get_size(), POOL.get_idle_size(), POOL.get_max_size()
+    return {
+        'enabled': True,
+        'min_size': POOL.get_min_size(),
+        'max_size': max_size,
+        'size': size,
+        'idle': idle,
+        'in_use': size - idle,
+        'saturation': round((size - idle) / max_size, 3),
+        **POOL_STATS
+    }
+
+
+@asynccontextmanager
+async def pg_connection():
+    """
+    Соединение с БД: из общего пула, а если пул не создан (тесты, скрипты) - отдельное
+    """
+    if POOL is None:
+        with span('pg-connect'):
+            conn = await asyncpg.connect(settings.POSTGRES_URL, connection_class=PgConnection)
+        try:
+            yield conn
+        finally:
+            await conn.close()  # Закрытие соединения с БД после выполнения
+        return
+    POOL_STATS['waiting'] += 1
+    POOL_STATS['max_waiting'] = max(POOL_STATS['max_waiting'], POOL_STATS['waiting'])
+    try:
+        with span('pg-connect'):
+            conn = await POOL.acquire(timeout=settings.PG_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        POOL_STATS['timeouts'] += 1
+        raise
+    finally:
+        POOL_STATS['waiting'] -= 1
+    POOL_STATS['acquired'] += 1
+    observe_pool(POOL.get_size(), POOL.get_idle_size(), POOL_STATS['waiting'])
+    try:
+        yield conn
+    finally:
+        await POOL.release(conn)
+        observe_pool(POOL.get_size(), POOL.get_idle_size(), POOL_STATS['waiting'])
+
+
 def init_close_pg(def_decorate):
     """
-    Инициализация соединения БД Постгрес
+    Выдача соединения БД Постгрес в функцию (параметр conn)
+    Длительность и ошибки учитываются в метриках по имени операции: Pg.<Класс>.<метод>
     """
+    histogram = PG_OPERATION_SECONDS.labels(def_decorate.__qualname__)
+    errors = PG_OPERATION_ERRORS.labels(def_decorate.__qualname__)
+
+    @functools.wraps(def_decorate)
     async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
         try:
-            conn = await asyncpg.connect(settings.POSTGRES_URL)
-        except Exception:
-            traceback.print_exc()
-            return False
-        try:
-            if conn:
-                result = await def_decorate(*args, **kwargs, conn=conn)
-                return result
+            async with pg_connection() as conn:
+                with span('pg'):
+                    return await def_decorate(*args, **kwargs, conn=conn)
         except Exception:
+            errors.inc()
             traceback.print_exc()
             return False
         finally:
-            if conn:
-                await conn.close()  # Закрытие соединения с БД после выполнения
+            histogram.observe(time.perf_counter() - started)
     return wrapper
 
 
@@ -49,51 +252,59 @@ class Pg:
 
         @staticmethod
         @init_close_pg
-        async def add(form: Registration, password_hashed: bytes, access_token: str, conn: asyncpg.Connection) -> bool:
-            result = await conn.fetch(
-                '''
-                INSERT INTO Users (email, psw_hash, name, token, status, dt)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                RETURNING email;
-                ''',
-                form.email,
-                password_hashed,
-                form.username,
-                access_token,
-                'NEW',
-                datetime.datetime.now().replace(microsecond=0)
-            )
+        async def add(form: Registration, password_hashed: bytes, access_token: str,
+                      outbox: tuple[str, dict] | None = None, conn: PgConnection = None) -> bool:
+            """
+            Добавление пользователя
+            :param outbox: задача (вид, данные) для Outbox, добавляется в той же транзакции
+            """
+            dt = datetime.datetime.now().replace(microsecond=0)
+            async with conn.transaction():
+                result = await conn.fetchval(
+                    STATEMENTS['users_add'],
+                    form.email,
+                    password_hashed,
+                    form.username,
+                    access_token,
+                    'NEW',
+                    dt
+                )
+                if outbox is not None:
+                    kind, payload = outbox
+                    await conn.fetchval(STATEMENTS['outbox_add'], kind, json.dumps(payload), dt)
+            await invalidate_user(str(form.email))
             return True if result else False
 
 
         @staticmethod
         @init_close_pg
-        async def get_all(conn) -> list[dict]:
-            return await conn.fetch('SELECT * FROM Users;')
+        async def get_all(conn: PgConnection) -> list[dict]:
+            return await conn.fetch(STATEMENTS['users_get_all'])
 
         @staticmethod
         @init_close_pg
-        async def get(email: str, conn) -> dict | bool:
-            result = await conn.fetch(
-                f'''
-                SELECT *
-                FROM Users
-                WHERE email = $1;
-                ''', email)
-            return result[0] if result is not False else False
+        async def get(email: str, conn: PgConnection) -> dict | bool:
+            result = await conn.fetchrow(STATEMENTS['users_get'], email)
+            return result if result is not None else False
+
+        @staticmethod
+        async def get_cached(email: str) -> dict | bool:
+            """
+            Пользователь из кэша USERS_CACHE, при промахе - из БД
+            """
+            user = USERS_CACHE.get(email)
+            if user is None:
+                generation = USERS_CACHE.generation
+                user = await Pg.Users.get(email)
+                if user:
+                    USERS_CACHE.set(email, user, generation=generation)
+            return user
 
         @staticmethod
         @init_close_pg
-        async def verified_true(email: str, conn) -> bool:
-            result = await conn.fetch(
-                '''
-                UPDATE Users
-                SET verified = TRUE
-                WHERE email = $1
-                RETURNING email;
-                ''',
-                email
-            )
+        async def verified_true(email: str, conn: PgConnection) -> bool:
+            result = await conn.fetchval(STATEMENTS['users_verified_true'], email)
+            await invalidate_user(email)
             return True if result else False
 
     # Операции над задачами
@@ -101,48 +312,131 @@ class Pg:
 
         @staticmethod
         @init_close_pg
-        async def add(email: str, task: TaskAdd, conn) -> dict | bool:
-            result = await conn.fetch(
-                '''
-                INSERT INTO Tasks (email, title, description, status, level, dt_to, dt)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                RETURNING id;
-                ''',
+        async def add(email: str, task: TaskAdd, conn: PgConnection) -> dict | bool:
+            result = await conn.fetchrow(
+                STATEMENTS['tasks_add'],
                 email, task.title, task.description, 'WAIT', task.level, task.dt_to,
                 datetime.datetime.now().replace(microsecond=0)
             )
-            return result[0] if result is not False else False
+            return result if result is not None else False
 
         @staticmethod
         @init_close_pg
-        async def get_all(email: str, conn) -> list | bool:
-            result = await conn.fetch('SELECT * FROM Tasks WHERE email = $1;', email)
-            return result
+        async def add_many(email: str, tasks: list[TaskAdd], conn: PgConnection) -> list[int] | bool:
+            """
+            Добавление списка задач одним запросом (одна транзакция)
+            :return: id созданных задач в порядке списка
+            """
+            result = await conn.fetch(
+                STATEMENTS['tasks_add_many'],
+                email, datetime.datetime.now().replace(microsecond=0),
+                [task.title for task in tasks],
+                [task.description for task in tasks],
+                [task.level for task in tasks],
+                [task.dt_to for task in tasks]
+            )
+            # id выдаются последовательностью в порядке вставки строк
+            return sorted(row['id'] for row in result)
 
         @staticmethod
         @init_close_pg
-        async def get(id: int, conn) -> dict | bool:
-            result = await conn.fetch('SELECT * FROM Tasks WHERE id = $1;', id)
-            return result[0] if result is not False else False
+        async def get_all(email: str, conn: PgConnection) -> list | bool:
+            return await conn.fetch(STATEMENTS['tasks_get_all'], email)
 
         @staticmethod
         @init_close_pg
-        async def delete(id: int, conn) -> bool:
-            result = await conn.fetch(
-                '''
-                DELETE FROM Tasks
-                WHERE id = $1
-                RETURNING id;
+        async def get_page(email: str, limit: int, after: tuple[datetime.datetime, int] | None = None,
+                           status: str | None = None, level: int | None = None,
+                           dt_to_from: datetime.datetime | None = None, dt_to_till: datetime.datetime | None = None,
+                           conn: PgConnection = None) -> list | bool:
+            """
+            Страница задач пользователя, отсортированная по (dt, id)
+            В запрос попадают только заданные условия, чтобы план шел по индексам TASKS_INDEXES,
+            а тексты запросов переиспользуются через кэш подготовленных запросов asyncpg
+            :param limit: размер страницы
+            :param after: ключ (dt, id) последней задачи предыдущей страницы
+            :param status: фильтр по статусу
+            :param level: фильтр по уровню важности
+            :param dt_to_from: дедлайн не раньше
+            :param dt_to_till: дедлайн раньше
+            """
+            conditions, args = ['email = $1'], [email]
+            for condition, value in (('status = ${}', status), ('level = ${}', level),
+                                     ('dt_to >= ${}', dt_to_from), ('dt_to < ${}', dt_to_till)):
+                if value is not None:
+                    args.append(value)
+                    conditions.append(condition.format(len(args)))
+            if after is not None:
+                args.extend(after)
+                conditions.append(f'(dt, id) > (${len(args) - 1}, ${len(args)})')
+            args.append(limit)
+            return await conn.fetch(
+                f'''
+                SELECT *
+                FROM Tasks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY dt, id
+                LIMIT ${len(args)};
                 ''',
-                id
+                *args
             )
-            return True if len(result) > 0 else False
+
+        @staticmethod
+        async def iter_all(email: str, batch_size: int):
+            """
+            Все задачи пользователя пачками по ключу (dt, id)
+            Каждая пачка читается отдельным запросом, соединение возвращается в пул между пачками
+            и не занято, пока медленный клиент принимает предыдущую
+            :param batch_size: размер пачки строк
+            :raise RuntimeError: ошибка чтения пачки
+            """
+            after = None
+            while True:
+                rows = await Pg.Tasks.get_page(email, batch_size, after)
+                if rows is False:
+                    raise RuntimeError('Ошибка чтения задач')
+                if rows:
+                    yield rows
+                if len(rows) < batch_size:
+                    break
+                after = rows[-1]['dt'], rows[-1]['id']
+
+        @staticmethod
+        @init_close_pg
+        async def get(id: int, conn: PgConnection) -> dict | bool:
+            result = await conn.fetchrow(STATEMENTS['tasks_get'], id)
+            return result if result is not None else False
+
+        @staticmethod
+        @init_close_pg
+        async def delete(id: int, conn: PgConnection) -> bool:
+            result = await conn.fetchval(STATEMENTS['tasks_delete'], id)
+            return result is not None
+
+        @staticmethod
+        @init_close_pg
+        async def set_status_many(email: str, ids: list[int], status: str, conn: PgConnection) -> list | bool:
+            """
+            Обновление статуса задач пользователя одним запросом
+            :return: id обновленных задач
+            """
+            return [row['id'] for row in await conn.fetch(STATEMENTS['tasks_set_status_many'], email, ids, status)]
+
+        @staticmethod
+        @init_close_pg
+        async def delete_many(email: str, ids: list[int], conn: PgConnection) -> list | bool:
+            """
+            Удаление задач пользователя одним запросом
+            :return: строки удаленных задач (id, file)
+            """
+            return await conn.fetch(STATEMENTS['tasks_delete_many'], email, ids)
 
         @staticmethod
         @init_close_pg
-        async def upd(email: str, id: int, data: dict, conn) -> bool:
+        async def upd(email: str, id: int, data: dict, conn: PgConnection) -> bool:
+            # набор полей динамический, поэтому запрос не из реестра
             set_str = prepare_data_to_upd(data)
-            result = await conn.fetch(
+            result = await conn.fetchval(
                 f'''
                 UPDATE Tasks
                 SET {set_str}
@@ -153,6 +447,42 @@ class Pg:
             )
             return True if result else False
 
+    # Очередь исходящих задач
+    class Outbox:
+
+        @staticmethod
+        @init_close_pg
+        async def claim(batch_size: int, lock_timeout: int, max_attempts: int | None = None,
+                        conn: PgConnection = None) -> list[dict] | bool:
+            """
+            Захват пачки новых задач, захваченные другими обработчиками пропускаются
+            Задачи, зависшие в отправке дольше lock_timeout, захватываются повторно,
+            а исчерпавшие max_attempts попыток получают статус FAILED
+            :param max_attempts: по умолчанию OUTBOX_MAX_ATTEMPTS
+            """
+            if max_attempts is None:
+                max_attempts = settings.OUTBOX_MAX_ATTEMPTS
+            now = datetime.datetime.now().replace(microsecond=0)
+            locked_before = now - datetime.timedelta(seconds=lock_timeout)
+            await conn.execute(STATEMENTS['outbox_expire'], locked_before, max_attempts)
+            rows = await conn.fetch(STATEMENTS['outbox_claim'], batch_size, now, locked_before, max_attempts)
+            return [{**dict(row), 'payload': json.loads(row['payload'])} for row in rows]
+
+        @staticmethod
+        @init_close_pg
+        async def done(ids: list[int], conn: PgConnection) -> bool:
+            await conn.execute(STATEMENTS['outbox_done'], ids)
+            return True
+
+        @staticmethod
+        @init_close_pg
+        async def fail(ids: list[int], max_attempts: int, conn: PgConnection) -> bool:
+            """
+            Возврат задач в очередь, после max_attempts попыток - статус FAILED
+            """
+            await conn.execute(STATEMENTS['outbox_fail'], ids, max_attempts)
+            return True
+
     class Dev:
 
         @staticmethod
@@ -162,6 +492,29 @@ class Pg:
             result = await conn.fetchval(f'SELECT COUNT(*) FROM "{table}";')
             return True if result == 0 else False
 
+        @staticmethod
+        @init_close_pg
+        async def create_indexes(conn) -> bool:
+            for query in TASKS_INDEXES:
+                await conn.execute(query)
+            return True
+
+        @staticmethod
+        @init_close_pg
+        async def get_indexes(table: str, conn) -> list[str]:
+            """
+            Имена индексов таблицы
+            """
+            rows = await conn.fetch('SELECT indexname FROM pg_indexes WHERE tablename = $1;', table.lower())
+            return [row['indexname'] for row in rows]
+
+        @staticmethod
+        @init_close_pg
+        async def create_outbox(conn) -> bool:
+            for query in OUTBOX_SCHEMA:
+                await conn.execute(query)
+            return True
+
 
 # async def conn_new():
 #     r = await Pg.Users.get_all()
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+try:
+    import brotli
+except ImportError:  # без brotli отдаются только gzip-варианты
+    brotli = None
+
+
+# типы файлов, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon')
+# файлы меньше этого размера не сжимаются
+COMPRESS_MIN_SIZE = 256
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """
+    Кодировки из заголовка Accept-Encoding с весами q (без веса - 1)
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, *params = part.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+def choose_encoding(accept_encoding: str, available: tuple[str, ...] | list[str]) -> str:
+    """
+    Кодировка ответа: из доступных с наибольшим q > 0, при равных весах - по порядку available
+    :param available: доступные кодировки в порядке предпочтения сервера
+    :return: кодировка | '' - без сжатия
+    """
+    weights = accepted_encodings(accept_encoding)
+    default = weights.get('*', 0.0)
+    best, best_q = '', 0.0
+    for encoding in available:
+        q = weights.get(encoding, default)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """
+    Совпадение ETag со списком If-None-Match (слабое сравнение, '*' - любая версия)
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+class StaticAsset:
+    """
+    Статический файл в памяти с вариантами сжатия
+    ::variants:: кодировка -> (содержимое, ETag), '' - без сжатия
+    """
+    __slots__ = ('media_type', 'variants')
+
+    def __init__(self, content: bytes, media_type: str):
+        self.media_type = media_type
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.variants = {'': (content, f'"{digest}"')}
+        if len(content) >= COMPRESS_MIN_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(content):
+                    self.variants[encoding] = (data, f'"{digest}-{encoding}"')
+
+
+class StaticAssets:
+    """
+    Раздача статических файлов (ASGI-приложение для app.mount)
+    При запуске файлы читаются в память, для них готовятся gzip/br-варианты и имена с хэшем содержимого:
+    css/custom.css -> css/custom.<хэш>.css. Файлы с хэшем отдаются с Cache-Control immutable,
+    по исходным именам - с обязательной проверкой ETag
+    """
+
+    def __init__(self, directory: str, prefix: str = '/static'):
+        self.directory = directory
+        self.prefix = prefix
+        # путь -> (файл, путь с хэшем)
+        self.files: dict[str, tuple[StaticAsset, bool]] = {}
+        # исходный путь -> url с хэшем
+        self.urls: dict[str, str] = {}
+        self.build()
+
+    def build(self) -> None:
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                asset = StaticAsset(content, mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                stem, ext = os.path.splitext(path)
+                fingerprinted = f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+                self.files[path] = (asset, False)
+                self.files[fingerprinted] = (asset, True)
+                self.urls[path] = f'{self.prefix}/{fingerprinted}'
+
+    def url(self, path: str) -> str:
+        """
+        Url файла с хэшем содержимого (для шаблонов: static_url('favicon.ico'))
+        """
+        path = path.lstrip('/')
+        return self.urls.get(path, f'{self.prefix}/{path}')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['method'] not in ('GET', 'HEAD'):
+            await PlainTextResponse('Method Not Allowed', status_code=405, headers={'Allow': 'GET, HEAD'})(scope, receive, send)
+            return
+        path, root_path = scope['path'], scope.get('root_path', '')
+        path = path[len(root_path):] if path.startswith(root_path) else path
+        item = self.files.get(path.lstrip('/'))
+        if item is None:
+            await PlainTextResponse('Not Found', status_code=404)(scope, receive, send)
+            return
+        asset, immutable = item
+        request_headers = {k: v for k, v in scope['headers'] if k in (b'accept-encoding', b'if-none-match')}
+        accept_encoding = request_headers.get(b'accept-encoding', b'').decode('latin-1')
+        encoding = choose_encoding(accept_encoding, [e for e in ('br', 'gzip') if e in asset.variants])
+        content, etag = asset.variants[encoding]
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE_CACHE if immutable else 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        if etag_matches(etag, request_headers.get(b'if-none-match', b'').decode('latin-1')):
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+        if scope['method'] == 'HEAD':
+            headers['Content-Length'] = str(len(content))
+            content = b''
+        await Response(content, media_type=asset.media_type, headers=headers)(scope, receive, send)
+
+
+# статические файлы приложения, собираются при импорте
+STATIC_ASSETS = StaticAssets('static')
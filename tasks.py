@@ -1,17 +1,67 @@
+import asyncio
+import functools
+import inspect
 from celery import Celery
-from email_handler import send_email
+from celery.signals import worker_process_init, worker_process_shutdown
+from email_handler import smtp_close
+from jobs import JOB_QUEUE
 from config import settings
 
 
-# Конфигурация Celery
-celery_app = Celery('tasks', broker=settings.REDIS_URL, encoding="utf8")
+# Конфигурация Celery (задачи модулей из include регистрируются при запуске воркера)
+celery_app = Celery('tasks', broker=settings.REDIS_URL, encoding="utf8", include=['outbox'])
 
-@celery_app.task
-def send_email_task(recipient: str, username: str, url_confirm: str) -> bool:
-    send_status = send_email(recipient,
-                             'Подтверждение электронной почты - To-Do micro-api',
-                             f'Здравствуйте, {username}\n'
-                             f'Для подтверждения своей почты в сервисе To-Do micro-api перейдите по ссылке ниже:\n'
-                             f'{url_confirm}'
-                             )
-    return send_status
+
+class Job:
+    """
+    Фоновая задача: .delay(...) ставит ее в Celery или в очередь процесса по настройке JOB_BACKEND
+    При ошибке задача повторяется до JOB_RETRIES раз с паузой JOB_RETRY_BACKOFF * 2 ** попытка секунд
+    Асинхронная функция в воркере Celery выполняется в собственном цикле событий
+    """
+
+    def __init__(self, func):
+        functools.update_wrapper(self, func)
+        self.func = func
+        target = func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            def target(*args, **kwargs):
+                return asyncio.run(func(*args, **kwargs))
+        self.celery_task = celery_app.task(
+            name=f'tasks.{func.__name__}',
+            autoretry_for=(Exception,),
+            max_retries=settings.JOB_RETRIES,
+            retry_backoff=settings.JOB_RETRY_BACKOFF,
+            retry_jitter=False
+        )(target)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        if settings.JOB_BACKEND == 'asyncio':
+            return JOB_QUEUE.submit(self.func, args, kwargs)
+        return self.celery_task.delay(*args, **kwargs)
+
+    async def adelay(self, *args, **kwargs):
+        """
+        Постановка задачи из цикла событий: публикация в брокер Celery блокирующая и выполняется в отдельном потоке
+        """
+        if settings.JOB_BACKEND == 'asyncio':
+            return JOB_QUEUE.submit(self.func, args, kwargs)
+        return await asyncio.to_thread(self.celery_task.delay, *args, **kwargs)
+
+
+def job(func) -> Job:
+    return Job(func)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # соединение SMTP открывается в каждом процессе воркера заново
+    smtp_close()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    smtp_close()
@@ -19,11 +19,14 @@ def pytest_collection_modifyitems(items):
 async def setup_db():
     global pool
     assert settings.POSTGRES_DB == 'test_postgres'
+    await Pg.Dev.create_outbox()
     yield
     r = await Pg.Dev.truncate('users')
     assert r == True
     r = await Pg.Dev.truncate('tasks')
     assert r == True
+    r = await Pg.Dev.truncate('outbox')
+    assert r == True
 
 
 @pytest_asyncio.fixture(scope='session')
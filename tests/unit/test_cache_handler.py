@@ -0,0 +1,73 @@
+import pytest
+from cache_handler import TTLCache, USERS_CACHE
+from sql_handler_v2 import Pg
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope='function')
+def clock():
+    return Clock()
+
+
+class TestTTLCache:
+
+    def test_get_set(self, clock):
+        cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+        assert cache.get('a') is None
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_ttl(self, clock):
+        cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=30)
+        clock.now = 11
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert len(cache) == 1
+
+    def test_lru(self, clock):
+        cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_invalidate_generation(self, clock):
+        cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+        cache.set('a', 1)
+        generation = cache.generation
+        cache.invalidate('a')
+        assert cache.get('a') is None
+        # данные прочитаны до сброса - не записываются
+        cache.set('a', 1, generation=generation)
+        assert cache.get('a') is None
+
+
+class TestUsersCache:
+
+    async def test_write_invalidates(self, user):
+        email = str(user.form.email)
+        assert await Pg.Users.add(user.form, user.password_hashed, user.access_token) == True
+        r = await Pg.Users.get_cached(email)
+        assert r['verified'] is None
+        hits = USERS_CACHE.hits
+        assert (await Pg.Users.get_cached(email))['verified'] is None
+        assert USERS_CACHE.hits == hits + 1
+        # запись в БД сбрасывает кэш: следующее чтение видит новые данные
+        assert await Pg.Users.verified_true(email) == True
+        r = await Pg.Users.get_cached(email)
+        assert r['verified'] == True
@@ -0,0 +1,72 @@
+import smtplib
+import pytest
+import email_handler
+
+
+class FakeSMTP:
+    """
+    Заглушка SMTP-сервера: считает подключения и отправленные письма
+    """
+    connections = 0
+    sent = []
+    fail_next = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.connections += 1
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        if FakeSMTP.fail_next:
+            FakeSMTP.fail_next -= 1
+            raise smtplib.SMTPServerDisconnected()
+        FakeSMTP.sent.append(msg['To'])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='function')
+def smtp(monkeypatch):
+    email_handler.smtp_close()
+    FakeSMTP.connections, FakeSMTP.sent, FakeSMTP.fail_next = 0, [], 0
+    monkeypatch.setattr(email_handler.smtplib, 'SMTP', FakeSMTP)
+    yield FakeSMTP
+    email_handler.smtp_close()
+
+
+class TestSendEmail:
+
+    def test_reuse_connection(self, smtp):
+        email_handler.send_email('a@test.com', 'Тема', 'Текст')
+        email_handler.send_email('b@test.com', 'Тема', 'Текст')
+        assert smtp.connections == 1
+        assert smtp.sent == ['a@test.com', 'b@test.com']
+
+    def test_reconnect(self, smtp):
+        email_handler.send_email('a@test.com', 'Тема', 'Текст')
+        smtp.fail_next = 1
+        email_handler.send_email('b@test.com', 'Тема', 'Текст')
+        assert smtp.connections == 2
+        assert smtp.sent == ['a@test.com', 'b@test.com']
+
+    def test_batch(self, smtp):
+        r = email_handler.send_emails([(f'{i}@test.com', 'Тема', 'Текст') for i in range(3)])
+        assert r == [True] * 3
+        assert smtp.connections == 1
+
+    def test_raise(self, smtp):
+        smtp.fail_next = 2
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            email_handler.send_email('a@test.com', 'Тема', 'Текст')
+        smtp.fail_next = 2
+        r = email_handler.send_emails([(f'{i}@test.com', 'Тема', 'Текст') for i in range(2)])
+        assert r == [False, True]
+        assert smtp.sent == ['1@test.com']
@@ -0,0 +1,97 @@
+import asyncio
+import redis.asyncio
+import threading
+import time
+import pytest
+import encryption
+from config import settings
+from encryption import (create_access_token, decode_token, TokenTypes, TOKENS_CACHE, hash_password_async,
+                        verify_password_async, run_in_hash_pool, HashPoolBusy, BANNED_HOSTS, is_banned,
+                        register_auth_failure, check_token)
+
+
+class TestDecodeToken:
+
+    def test_valid_cached(self):
+        TOKENS_CACHE.clear()
+        token = create_access_token('cache@test.com', TokenTypes.BEARER)
+        payload = decode_token(token)
+        assert payload['email'] == 'cache@test.com'
+        # clear() не сбрасывает счетчики, сравнивается прирост
+        hits = TOKENS_CACHE.hits
+        assert decode_token(token) == payload
+        assert TOKENS_CACHE.hits == hits + 1
+
+    def test_invalid_cached(self):
+        TOKENS_CACHE.clear()
+        assert decode_token('not-a-token') is None
+        assert decode_token('not-a-token') is None
+        assert len(TOKENS_CACHE) == 1
+
+    def test_secret_rotation(self, monkeypatch):
+        TOKENS_CACHE.clear()
+        token = create_access_token('cache@test.com', TokenTypes.BEARER)
+        assert decode_token(token) is not None
+        monkeypatch.setattr(settings, 'SECRET_KEY', settings.SECRET_KEY + '-rotated')
+        assert decode_token(token) is None
+
+
+class TestHashPool:
+
+    async def test_hash_verify(self):
+        hashed = await hash_password_async('Test123*')
+        assert await verify_password_async('Test123*', hashed) is True
+        assert await verify_password_async('Wrong123*', hashed) is False
+
+    async def test_busy(self, monkeypatch):
+        monkeypatch.setattr(encryption, 'HASH_SLOTS', threading.BoundedSemaphore(1))
+        first = run_in_hash_pool(time.sleep, 0.2)
+        with pytest.raises(HashPoolBusy):
+            await hash_password_async('Test123*')
+        await first
+        assert await hash_password_async('Test123*')
+
+
+class TestAuthBan:
+    # порог 3 ошибки в окне 1 с, блокировка на 1 с
+
+    @pytest.fixture(autouse=True)
+    def rules(self, monkeypatch):
+        monkeypatch.setitem(settings.AUTH_FAIL_RULES, '/test-ban', (3, 1, 1))
+
+    async def test_sliding_window(self):
+        for _ in range(2):
+            await register_auth_failure('10.0.0.1', '/test-ban')
+        await asyncio.sleep(1.1)
+        # прошлые ошибки вышли из окна
+        for _ in range(2):
+            await register_auth_failure('10.0.0.1', '/test-ban')
+        assert is_banned('10.0.0.1', '/test-ban') is False
+        await register_auth_failure('10.0.0.1', '/test-ban')
+        assert is_banned('10.0.0.1', '/test-ban') is True
+
+    async def test_ban_ttl_shared(self):
+        for _ in range(3):
+            await register_auth_failure('10.0.0.2', '/test-ban')
+        # воркер, который не видел ошибок, узнает о блокировке на первой своей ошибке
+        BANNED_HOSTS.clear()
+        assert is_banned('10.0.0.2', '/test-ban') is False
+        await register_auth_failure('10.0.0.2', '/test-ban')
+        assert is_banned('10.0.0.2', '/test-ban') is True
+        assert is_banned('10.0.0.2', '/task') is False
+        await asyncio.sleep(1.1)
+        assert is_banned('10.0.0.2', '/test-ban') is False
+
+    async def test_no_redis_when_not_banned(self, monkeypatch):
+        # проверка верного токена не обращается к Редис
+        calls = []
+
+        async def execute_command(self, *args, **kwargs):
+            calls.append(args)
+            raise AssertionError('Обращение к Редис')
+
+        monkeypatch.setattr(redis.asyncio.Redis, 'execute_command', execute_command)
+        token = create_access_token('nobody@test.com', TokenTypes.BEARER)
+        assert is_banned('10.0.0.3', '/task') is False
+        await check_token(token, TokenTypes.BEARER, '10.0.0.3', '/task')
+        assert calls == []
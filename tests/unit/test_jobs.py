@@ -0,0 +1,56 @@
+import pytest
+from config import settings
+from jobs import AsyncioJobQueue, JobQueueFull
+from tasks import Job
+
+
+class TestAsyncioJobQueue:
+
+    async def test_run_and_drain(self):
+        done = []
+
+        async def async_job(value):
+            done.append(value)
+
+        queue = AsyncioJobQueue(maxsize=10, workers=2, retries=0, backoff=0)
+        await queue.start()
+        queue.submit(async_job, (1,))
+        queue.submit(done.append, (2,))
+        await queue.drain(timeout=1)
+        assert sorted(done) == [1, 2]
+        with pytest.raises(JobQueueFull):
+            queue.submit(done.append, (3,))
+
+    async def test_retry(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise RuntimeError()
+
+        queue = AsyncioJobQueue(maxsize=10, workers=1, retries=2, backoff=0)
+        await queue.start()
+        queue.submit(flaky)
+        await queue.drain(timeout=1)
+        assert len(calls) == 3
+
+    async def test_full(self):
+        queue = AsyncioJobQueue(maxsize=1, workers=0, retries=0, backoff=0)
+        await queue.start()
+        queue.submit(print)
+        with pytest.raises(JobQueueFull):
+            queue.submit(print)
+
+
+class TestJob:
+
+    def test_celery_task(self):
+        async def async_job(value):
+            return value * 2
+
+        job = Job(async_job)
+        assert job.celery_task.name == 'tasks.async_job'
+        assert job.celery_task.max_retries == settings.JOB_RETRIES
+        assert job.celery_task.autoretry_for == (Exception,)
+        assert job.celery_task.run(2) == 4
@@ -0,0 +1,21 @@
+import datetime
+import json
+import json_handler
+from models import TasksList
+
+
+ROW = {'id': 1, 'email': 'test@test.com', 'title': 'Задача', 'description': None, 'status': 'WAIT', 'level': 0,
+       'dt_to': datetime.datetime(2025, 3, 8, 12, 0, 0), 'dt': datetime.datetime(2025, 3, 1, 9, 30, 0), 'file': None}
+
+
+def test_dumps_matches_model():
+    content = {'status': True, 'data': [ROW], 'next_cursor': None}
+    expected = json.loads(TasksList(**content).model_dump_json())
+    assert json.loads(json_handler.dumps(content)) == expected
+
+
+def test_dumps_fallback(monkeypatch):
+    content = {'status': True, 'data': [ROW], 'next_cursor': 'abc'}
+    fast = json_handler.dumps(content)
+    monkeypatch.setattr(json_handler, 'orjson', None)
+    assert json.loads(json_handler.dumps(content)) == json.loads(fast)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+import pytest
+import limiter_handler
+from limiter_handler import HybridRateLimiter
+from redis_handler import redis_conn
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope='function')
+def limiter():
+    limiter = HybridRateLimiter(times=5, minutes=1)
+    limiter.timer = Clock()
+    return limiter
+
+
+class TestHybridRateLimiter:
+
+    def test_take(self, limiter):
+        assert [limiter.take('k') for _ in range(5)] == [0] * 5
+        assert limiter.take('k') == 12
+        assert limiter.take('other') == 0
+        limiter.timer.now = 13
+        assert limiter.take('k') == 0
+
+    def test_reconcile(self, limiter):
+        for _ in range(2):
+            limiter.take('k')
+        bucket = limiter.buckets['k']
+        # другие воркеры израсходовали еще 2 токена в этом окне
+        limiter.reconcile(bucket, window=1, sent=2, total=4)
+        assert bucket.tokens == 1
+        limiter.take('k')
+        assert limiter.take('k') != 0
+        # новое окно - прошлый расход не учитывается
+        limiter.reconcile(bucket, window=2, sent=1, total=1)
+        assert bucket.seen == 1
+
+    async def counter(self, limiter, key: str) -> int:
+        window = int(time.time() // limiter.period)
+        async with redis_conn() as r:
+            return int(await r.get(f'hybrid-limiter:{limiter.index}:{key}:{window}') or 0)
+
+    async def test_sync(self, limiter):
+        key = f'sync-{uuid.uuid4().hex}'
+        for _ in range(2):
+            limiter.take(key)
+        await limiter.sync()
+        assert limiter.buckets[key].pending == 0
+        assert await self.counter(limiter, key) == 2
+
+    async def test_sync_timeout(self, limiter, monkeypatch):
+        sent = []
+
+        class SlowPipeline:
+
+            def incrby(self, key, amount):
+                sent.append(amount)
+
+            def expire(self, key, seconds):
+                pass
+
+            async def execute(self):
+                await asyncio.sleep(1)
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                pass
+
+        class SlowRedis:
+
+            def pipeline(self, transaction):
+                return SlowPipeline()
+
+        @asynccontextmanager
+        async def slow_redis_conn():
+            yield SlowRedis()
+
+        key = f'timeout-{uuid.uuid4().hex}'
+        for _ in range(3):
+            limiter.take(key)
+        monkeypatch.setattr(limiter_handler, 'redis_conn', slow_redis_conn)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.sync(), 0.05)
+        assert sent == [3]
+        # расход прерванной сверки не отправляется повторно
+        monkeypatch.setattr(limiter_handler, 'redis_conn', redis_conn)
+        limiter.take(key)
+        await limiter.sync()
+        assert await self.counter(limiter, key) == 1
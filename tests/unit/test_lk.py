@@ -90,3 +90,12 @@ def test_auth(url, status_code, user, add_user_cookies):
     assert 'Ваш токен' in r.text
     assert user.form.username in r.text
     assert user.access_token in r.text
+
+
+@pytest.mark.parametrize('url', ['/lk', '/lk/login', '/lk/registration', '/lk/verified'])
+def test_web_etag(url):
+    r = client.get(url)
+    etag = r.headers['etag']
+    r = client.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.content == b''
@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from main import app
+from timing_handler import span
+
+
+client = TestClient(app)
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_route_histogram():
+    labels = {'method': 'GET', 'route': '/lk/login', 'status': '200'}
+    before = sample('http_request_duration_seconds_count', labels)
+    client.get('/lk/login')
+    assert sample('http_request_duration_seconds_count', labels) == before + 1
+    r = client.get('/metrics')
+    assert r.status_code == 200
+    assert 'http_request_duration_seconds_bucket{le="0.001",method="GET",route="/lk/login",status="200"}' in r.text
+    assert 'pg_operation_duration_seconds_count{operation="Pg.Tasks.get_page"}' in r.text
+
+
+def test_dependency_errors():
+    before = sample('dependency_errors_total', {'dependency': 'test'})
+    try:
+        with span('test'):
+            raise ValueError
+    except ValueError:
+        pass
+    assert sample('dependency_errors_total', {'dependency': 'test'}) == before + 1
+    assert sample('dependency_duration_seconds_count', {'dependency': 'test'}) >= 1
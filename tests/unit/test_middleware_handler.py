@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+from main import app
+
+
+client = TestClient(app)
+
+
+def test_session_redirect():
+    client.cookies.set('user_session', 'abc')
+    r = client.get('/lk/login', follow_redirects=False)
+    assert r.status_code == 303
+    assert r.headers['location'] == '/lk/me'
+    r = client.get('/docs', follow_redirects=False)
+    assert r.status_code == 200
+    client.cookies.clear()
+
+
+def test_session_pass_through():
+    r = client.get('/lk/login', follow_redirects=False)
+    assert r.status_code == 200
@@ -0,0 +1,66 @@
+import pytest
+import outbox
+from config import settings
+from jobs import JOB_QUEUE, JobQueueFull
+from models import Registration
+from sql_handler_v2 import Pg, pg_connection
+
+
+@pytest.fixture(scope='function')
+def sent(monkeypatch):
+    sent = []
+
+    def send_emails(messages):
+        sent.extend(recipient for recipient, _, _ in messages)
+        return [not recipient.startswith('bad') for recipient, _, _ in messages]
+
+    monkeypatch.setattr(settings, 'JOB_BACKEND', 'asyncio')
+    monkeypatch.setattr(outbox, 'send_emails', send_emails)
+    return sent
+
+
+async def add_user(email: str, password_hashed: bytes) -> None:
+    form = Registration(username='Outbox', password='Test123*', confirm_password='Test123*', email=email)
+    payload = {'recipient': email, 'username': form.username, 'url_confirm': 'url'}
+    assert await Pg.Users.add(form, password_hashed, 'token', outbox=('confirm_email', payload)) == True
+
+
+async def test_dispatch(sent, user):
+    await add_user('ok@dispatch.com', user.password_hashed)
+    await add_user('bad@dispatch.com', user.password_hashed)
+    await JOB_QUEUE.start()
+    assert await outbox.dispatch_once(10) == 2
+    await JOB_QUEUE.drain(timeout=5)
+    assert sorted(sent) == ['bad@dispatch.com', 'ok@dispatch.com']
+    # неотправленное письмо вернулось в Outbox, отправленное удалено
+    r = await Pg.Outbox.claim(10, 300)
+    assert [row['payload']['recipient'] for row in r] == ['bad@dispatch.com']
+    await Pg.Outbox.done([row['id'] for row in r])
+
+
+async def test_dispatch_queue_stopped(sent, user):
+    await add_user('stopped@dispatch.com', user.password_hashed)
+    with pytest.raises(JobQueueFull):
+        await outbox.dispatch_once(10)
+    # пачка возвращена в Outbox
+    r = await Pg.Outbox.claim(10, 300)
+    assert len(r) == 1
+    await Pg.Outbox.done([r[0]['id']])
+
+
+async def test_dispatch_max_attempts(sent, user, monkeypatch):
+    # все письма пачки не отправлены - каждая попытка все равно записывается
+    monkeypatch.setattr(settings, 'OUTBOX_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(JOB_QUEUE, 'retries', 0)
+    await add_user('bad@attempts.com', user.password_hashed)
+    await JOB_QUEUE.start()
+    for _ in range(settings.OUTBOX_MAX_ATTEMPTS):
+        assert await outbox.dispatch_once(10) == 1
+        await JOB_QUEUE.drain(timeout=5)
+        await JOB_QUEUE.start()
+    assert await outbox.dispatch_once(10) == 0
+    await JOB_QUEUE.drain(timeout=5)
+    assert sent == ['bad@attempts.com'] * settings.OUTBOX_MAX_ATTEMPTS
+    async with pg_connection() as conn:
+        row = await conn.fetchrow("SELECT status, attempts FROM Outbox WHERE payload->>'recipient' = 'bad@attempts.com';")
+    assert (row['status'], row['attempts']) == ('FAILED', settings.OUTBOX_MAX_ATTEMPTS)
@@ -0,0 +1,30 @@
+import redis_handler
+from config import settings
+from redis_handler import (init_redis, close_redis, redis_conn, redis_add_keys, redis_get_keys, redis_delete_keys,
+                           redis_auth_failure)
+
+
+async def test_shared_client():
+    assert redis_handler.REDIS_CLIENT is None
+    # без общего клиента каждый вызов открывает отдельный
+    async with redis_conn() as r, redis_conn() as r_other:
+        assert r is not r_other
+    client = await init_redis()
+    try:
+        assert await init_redis() is client and redis_handler.AUTH_FAILURE is not None
+        async with redis_conn() as r:
+            assert r is client
+        assert client.connection_pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        await redis_add_keys({'test-shared-a': '1', 'test-shared-b': '2'}, ex=10)
+        assert await redis_get_keys(['test-shared-a', 'test-shared-b', 'test-shared-c']) == ['1', '2', None]
+        assert await redis_auth_failure('10.0.1.1', '/test-shared', 10, 1, 1) == 0
+    finally:
+        await close_redis()
+    assert redis_handler.REDIS_CLIENT is None and redis_handler.AUTH_FAILURE is None
+    # после закрытия клиент создается заново
+    client_reopened = await init_redis()
+    try:
+        assert client_reopened is not client
+        assert await redis_delete_keys(['test-shared-a', 'test-shared-b']) == 2
+    finally:
+        await close_redis()
@@ -0,0 +1,148 @@
+import io
+import pytest
+import pytest_asyncio
+import s3_handler
+from botocore.exceptions import ClientError
+from config import settings
+from s3_handler import (upload_stream, read_file_head, init_connection, init_client, close_client, delete_file, delete_files,
+                        UploadSizeError, UPLOAD_CHUNK_SIZE, DELETE_BATCH_SIZE)
+
+
+class AsyncFile:
+    """Файл с асинхронным read(size), как UploadFile"""
+
+    def __init__(self, content: bytes):
+        self.buffer = io.BytesIO(content)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.buffer.read(size)
+
+
+async def multipart_uploads(key: str) -> list:
+    async with init_connection() as s3:
+        response = await s3.list_multipart_uploads(Bucket=settings.BUCKET_NAME, Prefix=key)
+    return response.get('Uploads', [])
+
+
+async def put_files(keys: list[str]) -> None:
+    async with init_connection() as s3:
+        for key in keys:
+            await s3.put_object(Bucket=settings.BUCKET_NAME, Key=key, Body=b'test')
+
+
+@pytest_asyncio.fixture
+async def shared_client():
+    await init_client()
+    yield s3_handler.S3_CLIENT
+    await close_client()
+
+
+class TestUploadStream:
+
+    async def test_small(self):
+        assert await upload_stream(AsyncFile(b'small file'), 'test-upload-small.txt', 100, 'text/plain') == True
+        assert await read_file_head('test-upload-small.txt', 5) == (b'small', 10)
+
+    async def test_multipart(self):
+        # больше одной части - multipart-загрузка
+        content = b'0' * UPLOAD_CHUNK_SIZE + b'1' * 10
+        assert await upload_stream(AsyncFile(content), 'test-upload-multipart.bin', len(content)) == True
+        assert await read_file_head('test-upload-multipart.bin', 1) == (b'0', len(content))
+        assert await multipart_uploads('test-upload-multipart.bin') == []
+
+    async def test_too_large(self):
+        with pytest.raises(UploadSizeError):
+            await upload_stream(AsyncFile(b'0' * 11), 'test-upload-large.txt', 10)
+        # превышение обнаружено на второй части: multipart-загрузка отменена
+        content = b'0' * UPLOAD_CHUNK_SIZE * 2
+        with pytest.raises(UploadSizeError):
+            await upload_stream(AsyncFile(content), 'test-upload-large.bin', UPLOAD_CHUNK_SIZE + 1)
+        assert await multipart_uploads('test-upload-large.bin') == []
+        assert await read_file_head('test-upload-large.bin', 1) is None
+
+    async def test_error(self, monkeypatch):
+        monkeypatch.setattr(settings, 'BUCKET_NAME', 'no-such-bucket')
+        assert await upload_stream(AsyncFile(b'small file'), 'test-upload-error.txt', 100) == False
+
+
+class TestDelete:
+
+    async def test_delete_file(self):
+        await put_files(['test-delete-one.txt'])
+        assert await delete_file('test-delete-one.txt') == True
+        assert await read_file_head('test-delete-one.txt', 1) is None
+        # объекта нет - проверка HEAD без удаления
+        assert await delete_file('test-delete-one.txt') == False
+
+    async def test_batches(self, shared_client, monkeypatch):
+        calls = []
+        delete_objects = shared_client.delete_objects
+
+        async def counted_delete_objects(**kwargs):
+            calls.append(len(kwargs['Delete']['Objects']))
+            return await delete_objects(**kwargs)
+
+        monkeypatch.setattr(shared_client, 'delete_objects', counted_delete_objects)
+        existing = ['test-delete-a.txt', 'test-delete-b.txt']
+        await put_files(existing)
+        # отсутствующие ключи считаются удаленными, повторы схлопываются
+        keys = existing + [f'test-delete-missing-{i}' for i in range(DELETE_BATCH_SIZE)] + existing[:1]
+        result = await delete_files(keys)
+        assert calls == [DELETE_BATCH_SIZE, 2]
+        assert len(result) == DELETE_BATCH_SIZE + 2 and all(result.values())
+        assert await read_file_head(existing[0], 1) is None and await read_file_head(existing[1], 1) is None
+
+    async def test_errors(self, shared_client, monkeypatch):
+        calls = []
+
+        async def failing_delete_objects(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                return {'Errors': [{'Key': kwargs['Delete']['Objects'][0]['Key'], 'Code': 'AccessDenied'}]}
+            raise ClientError({'Error': {'Code': 'InternalError'}}, 'DeleteObjects')
+
+        monkeypatch.setattr(shared_client, 'delete_objects', failing_delete_objects)
+        keys = [f'test-delete-error-{i}' for i in range(DELETE_BATCH_SIZE * 2 + 1)]
+        result = await delete_files(keys)
+        assert len(calls) == 2
+        # ошибка по ключу - только он, ошибка запроса - все ключи с этой пачки
+        assert result[keys[0]] == False and all(result[key] for key in keys[1:DELETE_BATCH_SIZE])
+        assert not any(result[key] for key in keys[DELETE_BATCH_SIZE:])
+
+
+class TestSharedClient:
+
+    async def test_shared_client(self):
+        assert s3_handler.S3_CLIENT is None
+        # без общего клиента каждый вызов открывает отдельный
+        async with init_connection() as s3, init_connection() as s3_other:
+            assert s3 is not s3_other
+        await init_client()
+        try:
+            client = s3_handler.S3_CLIENT
+            await init_client()
+            assert s3_handler.S3_CLIENT is client
+            async with init_connection() as s3:
+                assert s3 is client
+            assert await delete_file('test-client-missing.txt') == False
+        finally:
+            await close_client()
+        assert s3_handler.S3_CLIENT is None and s3_handler.S3_CLIENT_STACK is None
+        # после закрытия клиент открывается заново
+        await init_client()
+        try:
+            assert s3_handler.S3_CLIENT is not None and s3_handler.S3_CLIENT is not client
+            assert await delete_file('test-client-missing.txt') == False
+        finally:
+            await close_client()
+
+    async def test_latency(self, shared_client, monkeypatch):
+        monkeypatch.setattr(s3_handler, 'S3_LATENCY', {})
+        await put_files(['test-latency.txt'])
+        stats = s3_handler.s3_stats()
+        assert list(stats) == ['PutObject'] and stats['PutObject']['count'] == 1
+        assert 0 < stats['PutObject']['avg_ms'] == stats['PutObject']['max_ms']
+        # отдельный клиент без обработчиков событий не учитывается
+        await close_client()
+        await put_files(['test-latency.txt'])
+        assert s3_handler.s3_stats()['PutObject']['count'] == 1
@@ -1,7 +1,7 @@
 import datetime
 import pytest_asyncio
 from pydantic import BaseModel
-from sql_handler_v2 import Pg
+from sql_handler_v2 import Pg, pg_connection, init_pool, close_pool, STATEMENTS
 from models import Registration, TaskAdd
 
 
@@ -51,6 +51,20 @@ class TestUsers:
         users_emails = [i['email'] for i in r]
         assert str(user.form.email) in users_emails
 
+    async def test_pool_statements(self, user):
+        # запросы реестра работают после возврата соединения в пул и подготавливаются на нем один раз
+        pool = await init_pool()
+        try:
+            for _ in range(pool.get_max_size() + 1):
+                r = await Pg.Users.get(str(user.form.email))
+                assert r['email'] == str(user.form.email)
+            async with pg_connection() as conn:
+                prepared = await conn.fetchval('SELECT COUNT(*) FROM pg_prepared_statements WHERE statement = $1;',
+                                               STATEMENTS['users_get'])
+            assert prepared == 1
+        finally:
+            await close_pool()
+
     async def test_verified_true(self, user):
         r = await Pg.Users.get(str(user.form.email))
         assert r['verified'] is None
@@ -84,8 +98,98 @@ class TestTasks:
         r = await Pg.Tasks.get(1)
         assert r['description'] == str(task_update.description)
 
+    async def test_create_indexes(self):
+        r = await Pg.Dev.create_indexes()
+        assert r == True
+        r = await Pg.Dev.get_indexes('Tasks')
+        assert {'tasks_email_dt_id_idx', 'tasks_email_status_dt_id_idx', 'tasks_email_level_dt_id_idx'} <= set(r)
+
+    async def test_get_page(self, user, task):
+        r = await Pg.Tasks.get_page(str(user.form.email), 10)
+        assert len(r) == 1
+        r = await Pg.Tasks.get_page(str(user.form.email), 10, (r[0]['dt'], r[0]['id']))
+        assert r == []
+        r = await Pg.Tasks.get_page(str(user.form.email), 10, level=task.level, status='WAIT')
+        assert len(r) == 1
+        r = await Pg.Tasks.get_page(str(user.form.email), 10, status='DONE')
+        assert r == []
+
     async def test_delete(self):
         r = await Pg.Tasks.delete(1)
         assert r == True
         r = await Pg.Tasks.get(1)
         assert r == False
+
+    async def test_add_many(self, user, task, task_update):
+        r = await Pg.Tasks.add_many(str(user.form.email), [task, task_update])
+        assert len(r) == 2 and r[0] < r[1]
+        r1 = await Pg.Tasks.get(r[0])
+        r2 = await Pg.Tasks.get(r[1])
+        assert r1['title'] == task.title
+        assert r2['title'] == task_update.title
+
+
+@pytest_asyncio.fixture(scope='module')
+def outbox_user():
+    return Registration(
+        username='Outbox',
+        password='Test123*',
+        confirm_password='Test123*',
+        email='outbox@test.com'
+    )
+
+
+class TestOutbox:
+
+    async def test_users_add(self, user, outbox_user):
+        payload = {'recipient': str(outbox_user.email), 'username': outbox_user.username, 'url_confirm': 'url'}
+        r = await Pg.Users.add(outbox_user, user.password_hashed, user.access_token, outbox=('confirm_email', payload))
+        assert r == True
+        # пользователь уже есть - транзакция откатывается вместе с задачей Outbox
+        r = await Pg.Users.add(outbox_user, user.password_hashed, user.access_token, outbox=('confirm_email', payload))
+        assert r == False
+        r = await Pg.Outbox.claim(10, 300)
+        assert len(r) == 1
+        assert r[0]['kind'] == 'confirm_email' and r[0]['payload'] == payload and r[0]['attempts'] == 1
+        # захваченная задача не выдается повторно до истечения lock_timeout
+        assert await Pg.Outbox.claim(10, 300) == []
+        r = await Pg.Outbox.claim(10, -1)
+        assert len(r) == 1 and r[0]['attempts'] == 2
+        assert await Pg.Outbox.done([r[0]['id']]) == True
+        assert await Pg.Outbox.claim(10, -1) == []
+
+    async def test_skip_locked(self, user, outbox_user):
+        for name in ('a', 'b'):
+            form = outbox_user.model_copy(update={'email': f'{name}@outbox.com'})
+            await Pg.Users.add(form, user.password_hashed, user.access_token, outbox=('confirm_email', {'n': name}))
+        async with pg_connection() as conn:
+            async with conn.transaction():
+                locked = await conn.fetchval("SELECT id FROM Outbox WHERE status = 'NEW' ORDER BY id LIMIT 1 FOR UPDATE;")
+                r = await Pg.Outbox.claim(10, 300)
+                assert [row['payload'] for row in r] == [{'n': 'b'}]
+        r2 = await Pg.Outbox.claim(10, 300)
+        assert [row['id'] for row in r2] == [locked]
+        await Pg.Outbox.done([locked, r[0]['id']])
+
+    async def test_fail_retry(self, user, outbox_user):
+        form = outbox_user.model_copy(update={'email': 'retry@outbox.com'})
+        await Pg.Users.add(form, user.password_hashed, user.access_token, outbox=('confirm_email', {}))
+        r = await Pg.Outbox.claim(10, 300)
+        assert await Pg.Outbox.fail([r[0]['id']], 2) == True
+        # возвращена в очередь
+        r = await Pg.Outbox.claim(10, 300)
+        assert len(r) == 1 and r[0]['attempts'] == 2
+        await Pg.Outbox.fail([r[0]['id']], 2)
+        # попытки исчерпаны - FAILED, больше не захватывается
+        assert await Pg.Outbox.claim(10, -1) == []
+
+    async def test_stuck_max_attempts(self, user, outbox_user):
+        # зависшая в отправке задача с исчерпанными попытками не захватывается, а получает FAILED
+        form = outbox_user.model_copy(update={'email': 'stuck@outbox.com'})
+        await Pg.Users.add(form, user.password_hashed, user.access_token, outbox=('confirm_email', {}))
+        assert len(await Pg.Outbox.claim(10, 300, 2)) == 1
+        r = await Pg.Outbox.claim(10, -1, 2)
+        assert len(r) == 1 and r[0]['attempts'] == 2
+        assert await Pg.Outbox.claim(10, -1, 2) == []
+        async with pg_connection() as conn:
+            assert await conn.fetchval('SELECT status FROM Outbox WHERE id = $1;', r[0]['id']) == 'FAILED'
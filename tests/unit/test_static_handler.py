@@ -0,0 +1,78 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from static_handler import STATIC_ASSETS, choose_encoding, etag_matches
+
+
+client = TestClient(app)
+
+
+def test_fingerprinted_url():
+    url = STATIC_ASSETS.url('favicon.ico')
+    assert url.startswith('/static/favicon.') and url != '/static/favicon.ico'
+    r = client.get('/lk')
+    assert url in r.text
+
+
+def test_immutable():
+    r = client.get(STATIC_ASSETS.url('css/custom.css'))
+    assert r.status_code == 200
+    assert 'immutable' in r.headers['cache-control']
+    r = client.get('/static/css/custom.css')
+    assert r.status_code == 200
+    assert r.headers['cache-control'] == 'no-cache'
+
+
+def test_etag():
+    r = client.get(STATIC_ASSETS.url('favicon.ico'))
+    r = client.get(STATIC_ASSETS.url('favicon.ico'), headers={'If-None-Match': r.headers['etag']})
+    assert r.status_code == 304
+
+
+def test_gzip():
+    r = client.get(STATIC_ASSETS.url('favicon.ico'), headers={'Accept-Encoding': 'gzip'})
+    assert r.headers.get('content-encoding') == 'gzip'
+    r = client.get('/static/unknown.css')
+    assert r.status_code == 404
+
+
+@pytest.mark.parametrize(
+    'accept_encoding, encoding',
+    [
+        ('gzip, deflate, br', 'br'),
+        ('br;q=0, gzip', 'gzip'),
+        ('br;q=0.5, gzip;q=0.8', 'gzip'),
+        ('BR ; Q=1, gzip', 'br'),
+        ('*', 'br'),
+        ('*;q=0.1, br;q=0', 'gzip'),
+        ('gzip;q=0, br;q=0', ''),
+        ('deflate', ''),
+        ('', ''),
+        ('gzip;q=abc', ''),
+    ]
+)
+def test_choose_encoding(accept_encoding, encoding):
+    assert choose_encoding(accept_encoding, ('br', 'gzip')) == encoding
+
+
+@pytest.mark.parametrize(
+    'if_none_match, matches',
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ('*', True),
+        ('"xyz"', False),
+        ('', False),
+        (None, False),
+    ]
+)
+def test_etag_matches(if_none_match, matches):
+    assert etag_matches('"abc"', if_none_match) == matches
+
+
+def test_encoding_refused():
+    r = client.get(STATIC_ASSETS.url('favicon.ico'), headers={'Accept-Encoding': 'br;q=0, gzip;q=0'})
+    assert 'content-encoding' not in r.headers
+    r = client.get('/lk', headers={'If-None-Match': '*'})
+    assert r.status_code == 304
@@ -0,0 +1,305 @@
+import base64
+import csv
+import io
+import json
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+from main import app
+from limiter_handler import RedisRateLimiter
+from routers.task import sniff_file_type
+from config import settings
+from encryption import create_access_token, TokenTypes
+from sql_handler_v2 import Pg
+from tests.unit.test_sql_handler import User
+
+
+async def no_limit(self, key):
+    return 0
+
+
+def make_user(user, email: str) -> User:
+    return User(
+        form=user.form.model_copy(update={'email': email}),
+        password_hashed=user.password_hashed,
+        access_token=create_access_token(email, TokenTypes.BEARER),
+        cookie={}
+    )
+
+
+@pytest.fixture(scope='module')
+def other_user(user):
+    return make_user(user, 'other@test.com')
+
+
+@pytest.fixture(scope='module')
+def page_user(user):
+    return make_user(user, 'page@test.com')
+
+
+@pytest_asyncio.fixture(scope='module', autouse=True)
+async def user_db(user, other_user, page_user):
+    for u in (user, other_user, page_user):
+        r = await Pg.Users.add(
+            u.form,
+            u.password_hashed,
+            u.access_token
+        )
+        assert r == True
+
+
+def auth(user) -> dict:
+    return {'Authorization': f'Bearer {user.access_token}'}
+
+
+@pytest.fixture(scope='module')
+def client(user, user_db):
+    # без ограничения частоты запросов, с общими пулом Постгрес и клиентами Редис и s3 (lifespan)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(RedisRateLimiter, '_check', no_limit)
+        with TestClient(app, headers=auth(user)) as client:
+            yield client
+
+
+def add_task(client, title='Test task', headers: dict | None = None) -> int:
+    r = client.post('/task/', json={'title': title, 'level': 1, 'dt_to': '2025-03-08T12:00:00'}, headers=headers)
+    assert r.status_code == 201
+    return r.json()['id']
+
+
+@pytest.mark.parametrize(
+    'head, file_ext, content_type',
+    [
+        (b'\x89PNG\r\n\x1a\n0000', 'png', 'image/png'),
+        (b'\xff\xd8\xff\xe0', 'jpeg', 'image/jpeg'),
+        (b'%PDF-1.7', 'pdf', 'application/pdf'),
+        (b'PK\x03\x04', 'docx', 'application/zip'),
+        ('Привет'.encode()[:-1], 'txt', 'text/plain; charset=utf-8'),
+        (b'%PDF-1.7', 'png', None),
+        (b'MZ\x90\x00', 'txt', None),
+        (b'\xff\xfe\xfd', 'txt', None),
+    ]
+)
+def test_sniff_file_type(head, file_ext, content_type):
+    assert sniff_file_type(head, file_ext) == content_type
+
+
+class TestUploadFile:
+
+    def test_upload(self, client):
+        id = add_task(client)
+        r = client.post('/task/uploadfile', data={'id': id}, files={'file': ('notes.txt', 'Привет'.encode())})
+        assert r.status_code == 200
+        url = r.json()['url']
+        assert url.endswith('.txt') and f'prefix=t-{id}-' in url
+        # к задаче уже прикреплен файл
+        r = client.post('/task/uploadfile', data={'id': id}, files={'file': ('notes.txt', 'Привет'.encode())})
+        assert r.status_code == 404
+
+    def test_size_limit(self, client, monkeypatch):
+        id = add_task(client)
+        monkeypatch.setattr(settings, 'UPLOAD_SIZE', 5)
+        r = client.post('/task/uploadfile', data={'id': id}, files={'file': ('notes.txt', b'0123456789')})
+        assert r.status_code == 413
+        r = client.post('/task/uploadfile', data={'id': id}, files={'file': ('notes.exe', b'0123')})
+        assert r.status_code == 406
+
+
+class TestPresign:
+
+    @staticmethod
+    def presign(client, id: int, filename: str) -> dict:
+        r = client.post('/task/presign/upload', json={'id': id, 'filename': filename})
+        assert r.status_code == 200
+        return r.json()
+
+    def test_upload_confirm_download(self, client):
+        id = add_task(client)
+        form = self.presign(client, id, 'notes.txt')
+        assert form['key'].startswith(f't-{id}-') and form['fields']['key'] == 'pending/' + form['key']
+        # размер ограничен подписанной политикой формы
+        policy = json.loads(base64.b64decode(form['fields']['policy']))
+        assert ['content-length-range', 0, settings.UPLOAD_SIZE] in policy['conditions']
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 404
+        r = httpx.post(form['url'], data=form['fields'], files={'file': 'Привет'.encode()})
+        assert r.status_code == 204
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 200
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 409
+        r = client.get('/task/presign/download', params={'id': id})
+        assert r.status_code == 200 and r.json()['key'] == form['key']
+        assert httpx.get(r.json()['url']).content == 'Привет'.encode()
+
+    def test_confirm_rejected(self, client, monkeypatch):
+        id = add_task(client)
+        form = self.presign(client, id, 'image.png')
+        r = client.post('/task/presign/confirm', json={'id': id + 1, 'key': form['key']})
+        assert r.status_code == 400
+        r = httpx.post(form['url'], data=form['fields'], files={'file': b'%PDF-1.7'})
+        assert r.status_code == 204
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 406
+        # неподтвержденный файл удален
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 404
+        r = client.get('/task/presign/download', params={'id': id})
+        assert r.status_code == 404
+        # размер проверяется и при подтверждении, если хранилище не применило политику
+        form = self.presign(client, id, 'notes.txt')
+        r = httpx.post(form['url'], data=form['fields'], files={'file': b'0123456789'})
+        assert r.status_code == 204
+        monkeypatch.setattr(settings, 'UPLOAD_SIZE', 5)
+        r = client.post('/task/presign/confirm', json={'id': id, 'key': form['key']})
+        assert r.status_code == 406
+
+
+class TestExport:
+
+    @pytest.mark.parametrize('format', ['ndjson', 'csv'])
+    def test_export(self, client, monkeypatch, format):
+        for i in range(3):
+            add_task(client, f'Export {i}')
+        # выгрузка из нескольких пачек
+        monkeypatch.setattr(settings, 'TASKS_EXPORT_BATCH', 2)
+        ids = [task['id'] for task in client.get('/task/', params={'limit': 100}).json()['data']]
+        r = client.get('/task/export', params={'format': format})
+        assert r.status_code == 200
+        assert r.headers['content-disposition'] == f'attachment; filename="tasks.{format}"'
+        if format == 'csv':
+            rows = list(csv.DictReader(io.StringIO(r.text)))
+            assert [int(row['id']) for row in rows] == ids
+        else:
+            rows = [json.loads(line) for line in r.text.splitlines()]
+            assert [row['id'] for row in rows] == ids
+            assert rows[-1]['title'] == 'Export 2'
+
+    def test_export_error(self, client, monkeypatch):
+        get_page = Pg.Tasks.get_page
+        calls = []
+
+        async def failing_get_page(*args, **kwargs):
+            calls.append(args)
+            return await get_page(*args, **kwargs) if len(calls) == 1 else False
+
+        add_task(client, 'Export error')
+        monkeypatch.setattr(settings, 'TASKS_EXPORT_BATCH', 1)
+        monkeypatch.setattr(Pg.Tasks, 'get_page', failing_get_page)
+        # ошибка после первой пачки обрывает передачу, а не завершает ее как успешную
+        with pytest.raises(ExceptionGroup) as e:
+            client.get('/task/export')
+        assert e.group_contains(RuntimeError)
+        assert len(calls) == 2
+
+
+class TestBulkAdd:
+
+    def test_add(self, client):
+        items = [{'title': f'Bulk {i}', 'level': i} for i in range(3)]
+        r = client.post('/task/bulk', json=items)
+        assert r.status_code == 201
+        ids = r.json()['ids']
+        assert len(ids) == 3 and ids == sorted(ids) and r.json()['errors'] == []
+        tasks = {task['id']: task for task in client.get('/task/', params={'limit': 100}).json()['data']}
+        assert [tasks[id]['title'] for id in ids] == ['Bulk 0', 'Bulk 1', 'Bulk 2']
+
+    def test_partial(self, client):
+        items = [{'title': 'Bulk ok'}, {'title': 'B'}, {'title': 'Bulk level', 'level': 9}]
+        r = client.post('/task/bulk', json=items)
+        assert r.status_code == 422
+        assert [error['index'] for error in r.json()['detail']] == [1, 2]
+        r = client.post('/task/bulk', params={'partial': True}, json=items)
+        assert r.status_code == 201
+        assert len(r.json()['ids']) == 1 and [error['index'] for error in r.json()['errors']] == [1, 2]
+
+    def test_invalid(self, client, monkeypatch):
+        # ни одной корректной задачи - ошибка, а не успешный ответ
+        r = client.post('/task/bulk', params={'partial': True}, json=[{'title': 'B'}])
+        assert r.status_code == 422 and r.json()['detail'][0]['index'] == 0
+        r = client.post('/task/bulk', json=[])
+        assert r.status_code == 422
+        monkeypatch.setattr(settings, 'TASKS_BULK_MAX', 2)
+        r = client.post('/task/bulk', json=[{'title': 'Bulk'}] * 3)
+        assert r.status_code == 413
+
+
+class TestBulkChange:
+
+    @staticmethod
+    def statuses(client, headers: dict | None = None) -> dict:
+        return {task['id']: task['status'] for task in client.get('/task/', params={'limit': 100}, headers=headers).json()['data']}
+
+    def test_set_status(self, client, other_user):
+        own = [add_task(client, f'Own {i}') for i in range(2)]
+        other = add_task(client, 'Other', headers=auth(other_user))
+        # повторы схлопываются, чужие и несуществующие id пропускаются
+        r = client.patch('/task/bulk', json={'ids': own + own[:1] + [other, 10 ** 6], 'status': 'DONE'})
+        assert r.status_code == 200
+        assert r.json()['results'] == {str(own[0]): True, str(own[1]): True, str(other): False, str(10 ** 6): False}
+        statuses = self.statuses(client)
+        assert statuses[own[0]] == statuses[own[1]] == 'DONE'
+        assert self.statuses(client, auth(other_user))[other] == 'WAIT'
+        r = client.patch('/task/bulk', json={'ids': own, 'status': 'UNKNOWN'})
+        assert r.status_code == 422
+
+    def test_delete(self, client, other_user):
+        own = [add_task(client, f'Own {i}') for i in range(2)]
+        other = add_task(client, 'Other', headers=auth(other_user))
+        r = client.request('DELETE', '/task/bulk', json={'ids': [own[0], other]})
+        assert r.status_code == 200
+        assert r.json()['results'] == {str(own[0]): True, str(other): False}
+        assert own[0] not in self.statuses(client) and own[1] in self.statuses(client)
+        assert other in self.statuses(client, auth(other_user))
+        # удаленная задача при повторе не найдена
+        r = client.request('DELETE', '/task/bulk', json={'ids': [own[0], own[1]]})
+        assert r.json()['results'] == {str(own[0]): False, str(own[1]): True}
+
+    def test_bulk_size(self, client, monkeypatch):
+        monkeypatch.setattr(settings, 'TASKS_BULK_MAX', 2)
+        r = client.patch('/task/bulk', json={'ids': [1, 2, 3], 'status': 'DONE'})
+        assert r.status_code == 413
+        r = client.request('DELETE', '/task/bulk', json={'ids': [1, 2, 3]})
+        assert r.status_code == 413
+        r = client.request('DELETE', '/task/bulk', json={'ids': []})
+        assert r.status_code == 422
+
+
+class TestPages:
+
+    @staticmethod
+    def pages(client, headers: dict, **params) -> list[list[int]]:
+        pages, cursor = [], None
+        while True:
+            r = client.get('/task/', params={**params, **({'cursor': cursor} if cursor else {})}, headers=headers)
+            assert r.status_code == 200
+            pages.append([task['id'] for task in r.json()['data']])
+            cursor = r.json()['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_cursor(self, client, page_user):
+        headers = auth(page_user)
+        ids = []
+        for i in range(5):
+            r = client.post('/task/', json={'title': f'Page {i}', 'level': i % 2}, headers=headers)
+            ids.append(r.json()['id'])
+        for i in (0, 2, 3):
+            client.patch('/task/', json={'id': ids[i], 'status': 'DONE'}, headers=headers)
+        # задачи одной секунды различаются по id в ключе (dt, id)
+        assert self.pages(client, headers, limit=2) == [ids[0:2], ids[2:4], ids[4:]]
+        assert self.pages(client, headers, limit=5) == [ids]
+        # фильтры сохраняются между страницами
+        assert self.pages(client, headers, limit=1, status='DONE', level=0) == [[ids[0]], [ids[2]]]
+        assert self.pages(client, headers, limit=1, status='DONE', level=1) == [[ids[3]]]
+        assert self.pages(client, headers, status='ARCHIVE') == [[]]
+
+    @pytest.mark.parametrize('cursor', ['garbage', base64.urlsafe_b64encode(b'2025-01-01T00:00:00|x').decode(), '!!'])
+    def test_bad_cursor(self, client, page_user, cursor):
+        r = client.get('/task/', params={'cursor': cursor}, headers=auth(page_user))
+        assert r.status_code == 400
+
+    def test_bad_limit(self, client, page_user):
+        r = client.get('/task/', params={'limit': settings.TASKS_PAGE_MAX + 1}, headers=auth(page_user))
+        assert r.status_code == 422
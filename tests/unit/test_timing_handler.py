@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from middleware_handler import ServerTimingMiddleware
+from timing_handler import TIMINGS, span, server_timing
+
+
+def test_span_not_sampled():
+    with span('pg'):
+        pass
+    assert TIMINGS.get() is None
+
+
+def test_span_sampled():
+    timings = {}
+    token = TIMINGS.set(timings)
+    try:
+        with span('jwt'):
+            pass
+
+        async def query():
+            async with span('pg'):
+                await asyncio.sleep(0)
+        asyncio.run(query())
+        asyncio.run(query())
+    finally:
+        TIMINGS.reset(token)
+    assert set(timings) == {'jwt', 'pg'}
+    assert timings['pg'][1] == 2
+    header = server_timing(timings, 0.01)
+    assert 'pg;dur=' in header and 'desc="x2"' in header and header.endswith('total;dur=10.00')
+
+
+def make_app(**options) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/')
+    async def index():
+        with span('template'):
+            pass
+        return {}
+
+    app.add_middleware(ServerTimingMiddleware, **options)
+    return app
+
+
+def test_server_timing_header(caplog):
+    with caplog.at_level(logging.INFO, logger='middleware_handler'):
+        r = TestClient(make_app(sample_rate=1.0, log=True)).get('/')
+    assert r.headers['server-timing'].startswith('template;dur=')
+    assert '"template"' in caplog.text
+    r = TestClient(make_app(sample_rate=0.0)).get('/')
+    assert 'server-timing' not in r.headers
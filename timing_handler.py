@@ -0,0 +1,64 @@
+import time
+from contextvars import ContextVar
+
+
+# замеры текущего запроса: этап -> [секунды, количество], None - запрос не попал в выборку
+TIMINGS: ContextVar[dict[str, list] | None] = ContextVar('timings', default=None)
+# обработчики каждого замера независимо от выборки (например, метрики): f(этап, секунды, ошибка)
+SPAN_LISTENERS = []
+
+
+def record(name: str, seconds: float, failed: bool = False) -> None:
+    """
+    Учет длительности этапа в замерах текущего запроса и передача его обработчикам SPAN_LISTENERS
+    """
+    for listener in SPAN_LISTENERS:
+        listener(name, seconds, failed)
+    timings = TIMINGS.get()
+    if timings is None:
+        return
+    item = timings.get(name)
+    if item is None:
+        timings[name] = [seconds, 1]
+    else:
+        item[0] += seconds
+        item[1] += 1
+
+
+class span:
+    """
+    Замер этапа запроса: with span('jwt'): ... | async with span('pg'): ...
+    Если запрос не попал в выборку и обработчиков SPAN_LISTENERS нет, время не замеряется
+    """
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        if SPAN_LISTENERS or TIMINGS.get() is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.started is not None:
+            record(self.name, time.perf_counter() - self.started, exc_type is not None)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.__exit__(exc_type, exc, tb)
+
+
+def server_timing(timings: dict[str, list], total: float) -> str:
+    """
+    Значение заголовка Server-Timing (мс), для повторявшихся этапов в desc количество
+    """
+    parts = []
+    for name, (seconds, count) in timings.items():
+        part = f'{name};dur={seconds * 1000:.2f}'
+        parts.append(f'{part};desc="x{count}"' if count > 1 else part)
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)